@@ -1,14 +1,20 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from scipy.stats import pearsonr, spearmanr
 import math
-import re
 import warnings
 import base64
+from survey_data import (
+    UPLOAD_TYPES, DatasetCache, array_fingerprint, fingerprint_bytes, format_bytes, load_dataset,
+)
+from survey_engine import (
+    SCORING_METHODS, ColumnArtifacts, cluster_order, correlate, correlation_matrix, item_group_scales,
+    paired_values, parse_scale_mapping, scale_specs, split_item_groups,
+)
+from survey_charts import (
+    HEATMAP_CMAPS, PLOT_FIGSIZE, SCATTER_FIGSIZE, SCATTER_MAX_POINTS, SCATTER_MODES, ChartCache, cached_png,
+    chart_figure, chart_grid_figure, chart_key, correlation_heatmap_figure, downsample_pairs, heatmap_figsize,
+    iter_cached_pngs, make_chart_pool, scatter_figure, scatter_style,
+)
 warnings.filterwarnings('ignore')
 
 # -------------------------
@@ -58,9 +64,9 @@ texts = {
         "Chinese": "将文件拖放至此"
     },
     "file_limit": {
-        "Indonesia": "Maksimal 200MB • Format: XLSX, XLS",
-        "English": "Limit 200MB • Format: XLSX, XLS",
-        "Chinese": "单个文件大小上限200MB • 支持XLSX、XLS格式"
+        "Indonesia": "Maksimal 200MB • Format: XLSX, XLS, CSV, TSV, TXT, GZ, ZIP",
+        "English": "Limit 200MB • Format: XLSX, XLS, CSV, TSV, TXT, GZ, ZIP",
+        "Chinese": "单个文件大小上限200MB • 支持XLSX、XLS、CSV、TSV、TXT、GZ、ZIP格式"
     },
     "browse_files": {
         "Indonesia": "Telusuri File",
@@ -132,15 +138,10 @@ texts = {
         "English": "No X or Y columns found to create totals",
         "Chinese": "未找到X或Y列以创建总分"
     },
-    "x_total_created": {
-        "Indonesia": "X_TOTAL dibuat dari {} kolom",
-        "English": "X_TOTAL created from {} columns",
-        "Chinese": "X_TOTAL 已从 {} 列创建"
-    },
-    "y_total_created": {
-        "Indonesia": "Y_TOTAL dibuat dari {} kolom",
-        "English": "Y_TOTAL created from {} columns",
-        "Chinese": "Y_TOTAL 已从 {} 列创建"
+    "scale_created": {
+        "Indonesia": "{} dibuat dari {} kolom",
+        "English": "{} created from {} columns",
+        "Chinese": "{} 已从 {} 列创建"
     },
     "could_not_create": {
         "Indonesia": "Tidak dapat membuat {}: {}",
@@ -217,6 +218,186 @@ texts = {
         "English": "Excel file is empty",
         "Chinese": "Excel文件为空"
     },
+    "memory_report": {
+        "Indonesia": "Memori data: {} → {} setelah pemadatan tipe ({:.1f}x lebih kecil)",
+        "English": "Data memory: {} → {} after dtype compaction ({:.1f}x smaller)",
+        "Chinese": "数据内存: {} → {}，类型压缩后 (缩小 {:.1f} 倍)"
+    },
+    "corr_matrix": {
+        "Indonesia": "Matriks Korelasi",
+        "English": "Correlation Matrix",
+        "Chinese": "相关矩阵"
+    },
+    "matrix_columns": {
+        "Indonesia": "Pilih kolom untuk matriks korelasi",
+        "English": "Select columns for the correlation matrix",
+        "Chinese": "选择相关矩阵的列"
+    },
+    "pairs_computed": {
+        "Indonesia": "{} pasangan variabel dihitung sekaligus",
+        "English": "{} variable pairs computed at once",
+        "Chinese": "一次计算了 {} 对变量"
+    },
+    "corr_coefficients": {
+        "Indonesia": "Koefisien korelasi",
+        "English": "Correlation coefficients",
+        "Chinese": "相关系数"
+    },
+    "p_values": {
+        "Indonesia": "Nilai p",
+        "English": "P-values",
+        "Chinese": "P值"
+    },
+    "mask_nonsig": {
+        "Indonesia": "Sembunyikan korelasi tidak signifikan (p ≥ 0.05)",
+        "English": "Hide non-significant correlations (p ≥ 0.05)",
+        "Chinese": "隐藏不显著的相关 (p ≥ 0.05)"
+    },
+    "cluster_order": {
+        "Indonesia": "Urutkan berdasarkan klaster",
+        "English": "Reorder by clustering",
+        "Chinese": "按聚类重新排序"
+    },
+    "color_map": {
+        "Indonesia": "Skema warna",
+        "English": "Color scheme",
+        "Chinese": "配色方案"
+    },
+    "heatmap_title": {
+        "Indonesia": "Peta Panas Korelasi ({})",
+        "English": "Correlation Heatmap ({})",
+        "Chinese": "相关热图 ({})"
+    },
+    "matrix_tables": {
+        "Indonesia": "Tabel koefisien dan nilai p",
+        "English": "Coefficient and p-value tables",
+        "Chinese": "系数和P值表"
+    },
+    "combined_charts": {
+        "Indonesia": "Gabungkan grafik tiap grup dalam satu gambar",
+        "English": "Combine each group's charts into one figure",
+        "Chinese": "将每组图表合并为一张图"
+    },
+    "chart_page": {
+        "Indonesia": "Halaman grafik (1–{})",
+        "English": "Chart page (1–{})",
+        "Chinese": "图表页码 (1–{})"
+    },
+    "chart_loading": {
+        "Indonesia": "Menggambar grafik...",
+        "English": "Rendering chart...",
+        "Chinese": "正在绘制图表..."
+    },
+    "scatter_style": {
+        "Indonesia": "Gaya grafik sebaran",
+        "English": "Scatter plot style",
+        "Chinese": "散点图样式"
+    },
+    "style_auto": {
+        "Indonesia": "Otomatis",
+        "English": "Automatic",
+        "Chinese": "自动"
+    },
+    "style_points": {
+        "Indonesia": "Titik",
+        "English": "Points",
+        "Chinese": "散点"
+    },
+    "style_counts": {
+        "Indonesia": "Jumlah per sel",
+        "English": "Counts per cell",
+        "Chinese": "单元计数"
+    },
+    "style_density": {
+        "Indonesia": "Kepadatan (hexbin)",
+        "English": "Density (hexbin)",
+        "Chinese": "密度 (六边形分箱)"
+    },
+    "scatter_sampled": {
+        "Indonesia": "Menampilkan sampel bertingkat {} dari {} pasangan data",
+        "English": "Showing a stratified sample of {} of {} data pairs",
+        "Chinese": "显示 {} 个分层抽样点（共 {} 对数据）"
+    },
+    "scale_scoring": {
+        "Indonesia": "Pengaturan skor skala",
+        "English": "Scale scoring options",
+        "Chinese": "量表计分设置"
+    },
+    "scoring_method": {
+        "Indonesia": "Metode skor",
+        "English": "Scoring method",
+        "Chinese": "计分方法"
+    },
+    "scoring_sum": {
+        "Indonesia": "Jumlah",
+        "English": "Sum",
+        "Chinese": "总和"
+    },
+    "scoring_mean": {
+        "Indonesia": "Rata-rata",
+        "English": "Mean",
+        "Chinese": "平均值"
+    },
+    "min_answered": {
+        "Indonesia": "Minimal item terjawab per skala",
+        "English": "Minimum answered items per scale",
+        "Chinese": "每个量表最少作答题数"
+    },
+    "reverse_items": {
+        "Indonesia": "Item dengan skor terbalik",
+        "English": "Reverse-coded items",
+        "Chinese": "反向计分题目"
+    },
+    "declare_range": {
+        "Indonesia": "Tetapkan rentang jawaban untuk item terbalik",
+        "English": "Declare the response range for reverse-coded items",
+        "Chinese": "为反向计分题目指定作答范围"
+    },
+    "scale_low": {
+        "Indonesia": "Pilihan jawaban terendah",
+        "English": "Lowest response option",
+        "Chinese": "最低作答选项"
+    },
+    "scale_high": {
+        "Indonesia": "Pilihan jawaban tertinggi",
+        "English": "Highest response option",
+        "Chinese": "最高作答选项"
+    },
+    "extra_scales": {
+        "Indonesia": "Skala tambahan (satu per baris: NAMA = item1, item2)",
+        "English": "Additional scales (one per line: NAME = item1, item2)",
+        "Chinese": "其他量表（每行一个：名称 = 题目1, 题目2）"
+    },
+    "reliability": {
+        "Indonesia": "Reliabilitas Skala",
+        "English": "Scale Reliability",
+        "Chinese": "量表信度"
+    },
+    "reliability_basis": {
+        "Indonesia": "({} item, {} responden dengan jawaban lengkap)",
+        "English": "({} items, {} respondents with complete answers)",
+        "Chinese": "（{} 个题目，{} 位完整作答者）"
+    },
+    "reliability_min_items": {
+        "Indonesia": "{}: reliabilitas membutuhkan minimal 2 item",
+        "English": "{}: reliability needs at least 2 items",
+        "Chinese": "{}：信度分析至少需要 2 个题目"
+    },
+    "item_total_r": {
+        "Indonesia": "Korelasi item-total terkoreksi",
+        "English": "Corrected item-total r",
+        "Chinese": "校正题总相关"
+    },
+    "alpha_if_deleted": {
+        "Indonesia": "Alpha jika item dihapus",
+        "English": "Alpha if item deleted",
+        "Chinese": "删除该题后的 Alpha"
+    },
+    "reading_rows": {
+        "Indonesia": "Membaca file... {} baris",
+        "English": "Reading file... {} rows",
+        "Chinese": "正在读取文件... {} 行"
+    },
     "features_title": {
         "Indonesia": "Fitur Utama",
         "English": "Key Features",
@@ -509,7 +690,7 @@ st.markdown(f"""
 # -------------------------
 uploaded_file = st.file_uploader(
     texts["upload"][language],
-    type=["xlsx", "xls"],
+    type=UPLOAD_TYPES,
     help=texts["file_limit"][language]
 )
 
@@ -518,75 +699,128 @@ def chunk_list(lst, n):
     for i in range(0, len(lst), n):
         yield lst[i:i + n]
 
-PLOT_FIGSIZE = (6, 3)
-PLOT_DPI = 100
+CHARTS_PER_PAGE = 12
+pending_charts = []  # (placeholder, cache key, render job) filled by render_pending_charts
 
-def plot_barh(ax, series, max_bars=20):
-    """Plot horizontal bar chart with error handling"""
-    try:
-        counts = series.value_counts(dropna=False)
-        if len(counts) == 0:
-            ax.text(0.5, 0.5, "No data", ha='center', va='center', fontsize=10, color='red')
-            return
-        
-        if len(counts) > max_bars:
-            counts = counts.nlargest(max_bars)
-        counts.sort_index().plot(kind='barh', ax=ax, color='#667eea')
-    except Exception as e:
-        ax.text(0.5, 0.5, f"Error: {str(e)[:30]}", ha='center', va='center', fontsize=9, color='red')
+def render_group_charts(artifacts, cols, group_name, combined=True):
+    """Lay out charts for a group of columns, one page of columns at a time
 
-def render_group_charts(df, cols, group_name):
-    """Render charts for a group of columns"""
+    Only placeholders are created here; the charts themselves are drawn by
+    render_pending_charts once the rest of the page has been sent. Tables,
+    histograms and fingerprints come from the dataset's ColumnArtifacts, so
+    only columns on the visible page that were never shown are computed.
+    cols may include scale_specs (name, items, reverse, method, min_answered,
+    scale_range), charted as their scale scores.
+    """
     if not cols:
         return
-    
-    st.markdown(f'<div class="content-card"><h3>📊 {texts["bar_chart"][language]} ({group_name})</h3></div>', unsafe_allow_html=True)
     max_per_row = 3
-    
-    for row in chunk_list(cols, max_per_row):
-        cols_ui = st.columns(len(row))
-        for i, col_name in enumerate(row):
-            with cols_ui[i]:
-                fig, ax = plt.subplots(figsize=PLOT_FIGSIZE, dpi=PLOT_DPI)
-                try:
-                    plot_barh(ax, df[col_name])
-                    ax.set_title(col_name, fontsize=10, fontweight='bold')
-                    ax.tick_params(axis='both', labelsize=8)
-                except Exception as e:
-                    ax.text(0.5, 0.5, "Chart error", ha='center', va='center', fontsize=10, color='red')
-                
-                plt.tight_layout()
-                st.pyplot(fig, clear_figure=True)
-                plt.close(fig)
-
-    st.markdown(f'<div class="content-card"><h3>📈 {texts["histogram"][language]} ({group_name})</h3></div>', unsafe_allow_html=True)
-    for row in chunk_list(cols, max_per_row):
-        cols_ui = st.columns(len(row))
-        for i, col_name in enumerate(row):
-            with cols_ui[i]:
-                fig, ax = plt.subplots(figsize=PLOT_FIGSIZE, dpi=PLOT_DPI)
-                try:
-                    coldata = pd.to_numeric(df[col_name], errors='coerce').dropna()
-                    if len(coldata) == 0:
-                        raise ValueError("no numeric data")
-                    
-                    num_bins = min(20, max(5, int(np.sqrt(len(coldata)))))
-                    ax.hist(coldata, bins=num_bins, edgecolor='black', alpha=0.7, color='#764ba2')
-                    ax.set_title(col_name, fontsize=10, fontweight='bold')
-                    ax.tick_params(axis='both', labelsize=8)
-                except Exception as e:
-                    ax.text(0.5, 0.5, "No numeric data", ha='center', va='center', fontsize=10, color='red')
-                
-                plt.tight_layout()
-                st.pyplot(fig, clear_figure=True)
-                plt.close(fig)
+    n_pages = math.ceil(len(cols) / CHARTS_PER_PAGE)
+    if n_pages > 1:
+        page = st.number_input(texts["chart_page"][language].format(n_pages), min_value=1,
+                               max_value=n_pages, value=1, key=f"chart_page_{group_name}")
+        cols = cols[(page - 1) * CHARTS_PER_PAGE:page * CHARTS_PER_PAGE]
+    sources = {"bar": artifacts.tables(cols), "hist": artifacts.histograms(cols)}
+    fingerprints = artifacts.fingerprints(cols)
+    cols = [artifacts.label(col) for col in cols]
+
+    def chart_slot(key, job):
+        slot = st.empty()
+        slot.caption("⏳ " + texts["chart_loading"][language])
+        pending_charts.append((slot, key, job))
+
+    # Bars and histograms carry no translated text, so the language is not part of the key
+    if combined:
+        fingerprint = fingerprint_bytes("".join(fingerprints[col_name] for col_name in cols).encode())
+
+    for kind, icon, title in (("bar", "📊", texts["bar_chart"][language]),
+                              ("hist", "📈", texts["histogram"][language])):
+        st.markdown(f'<div class="content-card"><h3>{icon} {title} ({group_name})</h3></div>', unsafe_allow_html=True)
+        if combined:
+            chart_slot(chart_key(fingerprint, kind + "_grid", PLOT_FIGSIZE, options=(max_per_row,)),
+                       (chart_grid_figure, (kind, sources[kind], cols), {"ncols": max_per_row}))
+            continue
+        for row in chunk_list(cols, max_per_row):
+            cols_ui = st.columns(len(row))
+            for i, col_name in enumerate(row):
+                with cols_ui[i]:
+                    chart_slot(chart_key(fingerprints[col_name], kind, PLOT_FIGSIZE),
+                               (chart_figure, (kind, sources[kind], col_name), None))
+
+def render_pending_charts():
+    """Fill chart placeholders, each one as soon as its image is ready"""
+    keyed_jobs = [(key, job) for _, key, job in pending_charts]
+    for i, png in iter_cached_pngs(get_chart_cache(), keyed_jobs, get_chart_pool()):
+        pending_charts[i][0].image(png, use_column_width=True)
+    pending_charts.clear()
+
+@st.cache_resource
+def get_dataset_cache():
+    """Parsed datasets shared by every rerun and session"""
+    return DatasetCache()
+
+@st.cache_resource
+def get_chart_cache():
+    """Rendered chart PNGs shared by every rerun and session"""
+    return ChartCache()
+
+@st.cache_resource
+def get_chart_pool():
+    """Worker processes that rasterize charts, shared by every session"""
+    return make_chart_pool()
+
+def get_upload_key(uploaded_file):
+    """Fingerprint upload bytes once per file instead of on every rerun"""
+    keys = st.session_state.setdefault('upload_keys', {})
+    if uploaded_file.file_id not in keys:
+        keys.clear()
+        keys[uploaded_file.file_id] = fingerprint_bytes(uploaded_file.getvalue())
+    return keys[uploaded_file.file_id]
+
+def make_read_progress():
+    """Progress callback for streamed reads; the bar appears only while parsing"""
+    state = {}
+
+    def update(rows_done, total_rows):
+        fraction = min(rows_done / total_rows, 1.0) if total_rows else 0.0
+        text = texts["reading_rows"][language].format(f"{rows_done:,}")
+        if 'bar' not in state:
+            state['bar'] = st.progress(fraction, text=text)
+        else:
+            state['bar'].progress(fraction, text=text)
+
+    def clear():
+        if 'bar' in state:
+            state['bar'].empty()
+
+    update.clear = clear
+    return update
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_column_artifacts(data_key, _df):
+    """Per-column tables, statistics and histograms of a dataset, filled in as columns are selected"""
+    return ColumnArtifacts(_df)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_correlation_matrix(dataset_key, cols, method, _df):
+    """Correlation matrix memoized per dataset, column set and method"""
+    return correlation_matrix(_df, list(cols), method)
 
 # -------------------------
 # MAIN LOGIC
 # -------------------------
 if uploaded_file is not None:
     try:
-        df = pd.read_excel(uploaded_file)
+        read_progress = make_read_progress()
+        dataset = load_dataset(
+            uploaded_file.getvalue(),
+            get_dataset_cache(),
+            name=uploaded_file.name,
+            key=get_upload_key(uploaded_file),
+            progress=read_progress
+        )
+        read_progress.clear()
+        df = dataset.raw
         
         if df.empty:
             st.error(texts["empty_file"][language])
@@ -598,21 +832,15 @@ if uploaded_file is not None:
 
     st.markdown(f'<div class="content-card"><h2>📁 {texts["preview"][language]}</h2></div>', unsafe_allow_html=True)
     st.dataframe(df, use_container_width=True)
+    if dataset.memory_report:
+        mem_before, mem_after = dataset.memory_report
+        st.caption("💾 " + texts["memory_report"][language].format(
+            format_bytes(mem_before), format_bytes(mem_after), mem_before / max(mem_after, 1)))
 
-    df = df.copy()
-
-    maybe_numeric = []
-    for col in df.columns:
-        try:
-            coerced = pd.to_numeric(df[col], errors='coerce')
-            non_na_ratio = coerced.notna().sum() / max(len(coerced), 1)
-            if non_na_ratio >= 0.5:
-                df[col] = coerced
-                maybe_numeric.append(col)
-        except Exception:
-            continue
+    # Cached frames are shared between sessions, so never mutate them in place
+    df = dataset.df.copy(deep=False)
 
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    numeric_cols = dataset.numeric_cols
 
     st.markdown(f'<div class="content-card"><h2>📈 {texts["desc"][language]}</h2></div>', unsafe_allow_html=True)
 
@@ -626,57 +854,81 @@ if uploaded_file is not None:
         )
 
         if selected_desc_cols:
-            st.write(df[selected_desc_cols].describe())
+            # Only columns never selected before are computed; the rest come from the cache
+            artifacts = get_column_artifacts(dataset.key, dataset.df)
+            st.write(artifacts.describe(selected_desc_cols))
 
-            def starts_with_letter(c, letter):
-                try:
-                    return bool(re.match(rf"^\s*{letter}", str(c), flags=re.I))
-                except:
-                    return False
+            x_cols, y_cols, other_cols = split_item_groups(selected_desc_cols)
+            combined_charts = st.checkbox(texts["combined_charts"][language], value=True, key="combined_charts")
 
-            x_cols = [c for c in selected_desc_cols if starts_with_letter(c, 'x')]
-            y_cols = [c for c in selected_desc_cols if starts_with_letter(c, 'y')]
-            other_cols = [c for c in selected_desc_cols if c not in x_cols + y_cols]
+            scale_items = item_group_scales(selected_desc_cols)
+            with st.expander("⚙️ " + texts["scale_scoring"][language]):
+                scoring_method = st.radio(
+                    texts["scoring_method"][language], SCORING_METHODS,
+                    format_func=lambda m: texts[f"scoring_{m}"][language], horizontal=True, key="scoring_method"
+                )
+                min_answered = st.number_input(texts["min_answered"][language], min_value=1, value=1, step=1,
+                                               key="min_answered")
+                reverse_items = st.multiselect(texts["reverse_items"][language], numeric_cols,
+                                               key="reverse_items")
+                # Without a declared range each item is mirrored on its own observed min and max
+                scale_range = None
+                if st.checkbox(texts["declare_range"][language], key="declare_range"):
+                    observed = df[selected_desc_cols]
+                    low_col, high_col = st.columns(2)
+                    with low_col:
+                        scale_low = st.number_input(texts["scale_low"][language],
+                                                    value=float(np.nanmin(observed.min())), key="scale_low")
+                    with high_col:
+                        scale_high = st.number_input(texts["scale_high"][language],
+                                                     value=float(np.nanmax(observed.max())), key="scale_high")
+                    scale_range = (scale_low, scale_high)
+                extra_scales = st.text_area(texts["extra_scales"][language], key="extra_scales")
+            try:
+                scale_items.update(parse_scale_mapping(extra_scales, numeric_cols))
+            except ValueError as e:
+                st.warning(texts["could_not_create"][language].format(texts["extra_scales"][language], str(e)))
 
-            x_total = None
-            y_total = None
-            
-            if x_cols:
-                try:
-                    x_total = df[x_cols].sum(axis=1)
-                    df['X_TOTAL'] = x_total
-                    st.success("✅ " + texts["x_total_created"][language].format(len(x_cols)))
-                except Exception as e:
-                    st.warning(texts["could_not_create"][language].format("X_TOTAL", str(e)))
-            
-            if y_cols:
-                try:
-                    y_total = df[y_cols].sum(axis=1)
-                    df['Y_TOTAL'] = y_total
-                    st.success("✅ " + texts["y_total_created"][language].format(len(y_cols)))
-                except Exception as e:
-                    st.warning(texts["could_not_create"][language].format("Y_TOTAL", str(e)))
+            # Every scale is scored in one pass and cached with the dataset's other artifacts
+            total_cols_to_plot = []
+            try:
+                total_cols_to_plot = scale_specs(scale_items, reverse_items, scoring_method, min_answered,
+                                                 scale_range)
+                scores = artifacts.scores(total_cols_to_plot)
+                for name, items in scale_items.items():
+                    df[name] = scores[name]
+                    st.success("✅ " + texts["scale_created"][language].format(name, len(items)))
+            except Exception as e:
+                st.warning(texts["could_not_create"][language].format(", ".join(map(str, scale_items)), str(e)))
+                total_cols_to_plot = []
             
             if x_cols:
-                render_group_charts(df, x_cols, texts["x_group"][language])
+                render_group_charts(artifacts, x_cols, texts["x_group"][language], combined_charts)
             if y_cols:
-                render_group_charts(df, y_cols, texts["y_group"][language])
+                render_group_charts(artifacts, y_cols, texts["y_group"][language], combined_charts)
             if other_cols:
-                render_group_charts(df, other_cols, texts["other_group"][language])
+                render_group_charts(artifacts, other_cols, texts["other_group"][language], combined_charts)
             
             st.markdown("---")
             st.markdown(f'<div class="content-card"><h2>📊 {texts["total_analysis"][language]}</h2></div>', unsafe_allow_html=True)
             
-            total_cols_to_plot = []
-            if x_total is not None:
-                total_cols_to_plot.append('X_TOTAL')
-            if y_total is not None:
-                total_cols_to_plot.append('Y_TOTAL')
-            
             if total_cols_to_plot:
-                render_group_charts(df, total_cols_to_plot, texts["total_scores"][language])
+                render_group_charts(artifacts, total_cols_to_plot, texts["total_scores"][language], combined_charts)
                 st.markdown(f"### {texts['summary_stats'][language]}")
-                st.write(df[total_cols_to_plot].describe())
+                st.write(artifacts.describe(total_cols_to_plot))
+
+                # Alpha and item statistics per scale, each from a single covariance matrix
+                st.markdown(f'<div class="content-card"><h2>🧪 {texts["reliability"][language]}</h2></div>', unsafe_allow_html=True)
+                for name, reliability in artifacts.reliability(total_cols_to_plot).items():
+                    if reliability["k"] < 2:
+                        st.info(texts["reliability_min_items"][language].format(name))
+                        continue
+                    basis = texts["reliability_basis"][language].format(reliability["k"], f"{reliability['n']:,}")
+                    st.markdown(f"**{name}**: Cronbach's α = {reliability['alpha']:.4f} {basis}")
+                    st.dataframe(reliability["items"].rename(columns={
+                        "item_total_r": texts["item_total_r"][language],
+                        "alpha_if_deleted": texts["alpha_if_deleted"][language],
+                    }), use_container_width=True)
             else:
                 st.info(texts["no_xy_cols"][language])
 
@@ -690,44 +942,84 @@ if uploaded_file is not None:
             var_y = st.selectbox(texts["y_variable"][language], [c for c in numeric_cols if c != var_x])
 
         method = st.radio(texts["corr_method"][language], ["pearson", "spearman"])
+        scatter_mode = st.radio(
+            texts["scatter_style"][language], SCATTER_MODES,
+            format_func=lambda m: texts[f"style_{m}"][language], horizontal=True, key="scatter_mode"
+        )
 
         if st.button(texts["run_test"][language]):
             try:
-                temp_df = df[[var_x, var_y]].copy()
-                temp_df[var_x] = pd.to_numeric(temp_df[var_x], errors='coerce')
-                temp_df[var_y] = pd.to_numeric(temp_df[var_y], errors='coerce')
-                temp_df = temp_df.dropna()
+                x_data, y_data = paired_values(df, var_x, var_y)
 
-                if len(temp_df) < 2:
+                if len(x_data) < 2:
                     st.warning(texts["not_enough_data"][language])
                 else:
-                    x_data = temp_df[var_x].values
-                    y_data = temp_df[var_y].values
-                    
                     if np.std(x_data) == 0 or np.std(y_data) == 0:
                         st.warning(texts["constant_values"][language])
                     else:
-                        if method == "pearson":
-                            corr, pval = pearsonr(x_data, y_data)
-                        else:
-                            corr, pval = spearmanr(x_data, y_data)
+                        corr, pval = correlate(x_data, y_data, method)
                         
                         st.success("✅ " + texts["correlation_result"][language].format(method, var_x, var_y, f"{corr:.4f}"))
-                        st.info("📊 " + texts["pvalue_sample"][language].format(f"{pval:.4g}", len(temp_df)))
+                        st.info("📊 " + texts["pvalue_sample"][language].format(f"{pval:.4g}", len(x_data)))
                         
-                        fig, ax = plt.subplots(figsize=(8, 5), dpi=100)
-                        ax.scatter(x_data, y_data, alpha=0.6, edgecolors='black', linewidth=0.5, color='#667eea')
-                        ax.set_xlabel(var_x, fontsize=10)
-                        ax.set_ylabel(var_y, fontsize=10)
-                        ax.set_title(texts["scatter_title"][language].format(var_x, var_y, f"{corr:.4f}", f"{pval:.4g}"), 
-                                   fontsize=11, fontweight='bold')
-                        ax.grid(True, alpha=0.3)
-                        plt.tight_layout()
-                        st.pyplot(fig, clear_figure=True)
-                        plt.close(fig)
+                        scatter_title = texts["scatter_title"][language].format(var_x, var_y, f"{corr:.4f}", f"{pval:.4g}")
+                        scatter_kind = scatter_style(x_data, y_data, scatter_mode)
+                        scatter_key = chart_key(
+                            array_fingerprint(x_data, y_data), "scatter", SCATTER_FIGSIZE, language,
+                            (str(var_x), str(var_y), method, scatter_kind)
+                        )
+                        png = cached_png(get_chart_cache(), scatter_key, lambda: scatter_figure(
+                            x_data, y_data, var_x, var_y, scatter_title, style=scatter_kind
+                        ))
+                        st.image(png, use_column_width=True)
+                        if scatter_kind == "points" and len(x_data) > SCATTER_MAX_POINTS:
+                            shown = len(downsample_pairs(x_data, y_data)[0])
+                            st.caption(texts["scatter_sampled"][language].format(f"{shown:,}", f"{len(x_data):,}"))
                         
             except Exception as e:
                 st.error(texts["error_corr"][language].format(str(e)))
+
+        st.markdown(f'<div class="content-card"><h3>🧮 {texts["corr_matrix"][language]}</h3></div>', unsafe_allow_html=True)
+        matrix_cols = st.multiselect(
+            texts["matrix_columns"][language],
+            numeric_cols,
+            default=numeric_cols[:10],
+            key="matrix_cols"
+        )
+        matrix_method = st.radio(texts["corr_method"][language], ["pearson", "spearman"], key="matrix_method", horizontal=True)
+
+        if len(matrix_cols) >= 2:
+            r_mat, p_mat, n_mat = cached_correlation_matrix(dataset.key, tuple(matrix_cols), matrix_method, df)
+            st.info("📊 " + texts["pairs_computed"][language].format(len(matrix_cols) * (len(matrix_cols) - 1) // 2))
+
+            heat_col1, heat_col2, heat_col3 = st.columns(3)
+            with heat_col1:
+                heat_mask = st.checkbox(texts["mask_nonsig"][language], key="heat_mask")
+            with heat_col2:
+                heat_cluster = st.checkbox(texts["cluster_order"][language], key="heat_cluster")
+            with heat_col3:
+                heat_cmap = st.selectbox(texts["color_map"][language], HEATMAP_CMAPS, key="heat_cmap")
+
+            # Only the drawing depends on these options; the matrix comes from the cache
+            heat_key = chart_key(
+                array_fingerprint(r_mat.to_numpy(), p_mat.to_numpy()), "heatmap", heatmap_figsize(len(r_mat)),
+                language,
+                (tuple(map(str, matrix_cols)), heat_mask, heat_cluster, heat_cmap)
+            )
+            png = cached_png(get_chart_cache(), heat_key, lambda: correlation_heatmap_figure(
+                r_mat, p_mat,
+                alpha=0.05 if heat_mask else None,
+                order=cluster_order(r_mat.to_numpy()) if heat_cluster else None,
+                title=texts["heatmap_title"][language].format(matrix_method.capitalize()),
+                cmap=heat_cmap
+            ))
+            st.image(png, use_column_width=True)
+
+            with st.expander(texts["matrix_tables"][language]):
+                st.markdown(f"**{texts['corr_coefficients'][language]}**")
+                st.dataframe(r_mat.style.format("{:.4f}"), use_container_width=True)
+                st.markdown(f"**{texts['p_values'][language]}**")
+                st.dataframe(p_mat.style.format("{:.4g}"), use_container_width=True)
     else:
         st.info(texts["need_two_cols"][language])
 
@@ -762,4 +1054,7 @@ else:
             <div class="feature-title">{texts["feature3_title"][language]}</div>
             <div class="feature-desc">{texts["feature3_desc"][language]}</div>
         </div>
-        """, unsafe_allow_html=True)
\ No newline at end of file
+        """, unsafe_allow_html=True)
+
+# Charts laid out by render_group_charts are drawn last, after every table is on screen
+render_pending_charts()
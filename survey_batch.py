@@ -0,0 +1,151 @@
+"""Batch analysis of a directory of survey files
+
+Runs the same pipeline as the Streamlit apps (loading, numeric coercion,
+descriptive statistics, X/Y totals and their reliability, normality and the
+st17 auto association) on every workbook in a directory, one process per core:
+
+    python survey_batch.py surveys/ -o results/ --pair Age X_TOTAL
+    python survey_batch.py surveys/ --scale "WELLBEING=Q1,Q2,Q3" --reverse Q2 --scale-min 1 --scale-max 5
+
+Each input gets results/<file>.json; results/summary.csv combines them.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from survey_data import UPLOAD_TYPES, DatasetCache, load_dataset
+from survey_engine import SCORING_METHODS, analyze_dataset, parse_scale_mapping
+
+SUMMARY_FIELDS = [
+    "file", "status", "rows", "numeric_columns", "x_items", "y_items",
+    "method", "rho", "p_value", "n", "seconds", "error",
+]
+
+
+def find_survey_files(directory):
+    """Supported survey files directly inside directory, sorted by name"""
+    suffixes = tuple("." + ext for ext in UPLOAD_TYPES)
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(suffixes) and not name.startswith(("~$", "."))
+    )
+
+
+def _jsonable(value):
+    """Replace NaN/inf and NumPy scalars so json.dump accepts the result"""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def analyze_file(path, out_dir, pairs=(), scoring=None):
+    """Worker: analyze one file, write its JSON and return a summary row
+
+    scoring holds analyze_dataset's reverse/method/min_answered/scale_range
+    options, plus scale_text: "NAME = item1, item2" lines parsed against each
+    file's columns like the apps' extra scales, so an unknown item fails the
+    file instead of silently shrinking its scale.
+    """
+    started = time.time()
+    name = os.path.basename(path)
+    row = {"file": name, "status": "ok"}
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        # No in-memory cache in a one-shot worker; sidecars still apply
+        dataset = load_dataset(data, DatasetCache(max_bytes=0), name=name)
+        options = dict(scoring or {})
+        scale_text = options.pop("scale_text", "")
+        if scale_text:
+            options["scales"] = parse_scale_mapping(scale_text, dataset.numeric_cols)
+        result = analyze_dataset(dataset.df, dataset.numeric_cols, pairs, **options)
+        result["file"] = name
+        with open(os.path.join(out_dir, name + ".json"), "w", encoding="utf-8") as f:
+            json.dump(_jsonable(result), f, ensure_ascii=False, indent=2)
+
+        row.update(
+            rows=result["rows"],
+            numeric_columns=len(result["numeric_columns"]),
+            x_items=len(result["x_items"]),
+            y_items=len(result["y_items"]),
+        )
+        if result["associations"]:
+            first = result["associations"][0]
+            row.update(method=first["method"], rho=first["rho"], p_value=first["p_value"], n=first["n"])
+    except Exception as e:
+        row.update(status="error", error=str(e))
+    row["seconds"] = round(time.time() - started, 3)
+    return row
+
+
+def run_batch(in_dir, out_dir, workers=None, pairs=(), scoring=None):
+    """Analyze every survey file in in_dir on a process pool; return summary rows"""
+    files = find_survey_files(in_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(analyze_file, path, out_dir, pairs, scoring): path for path in files}
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            print(f"[{len(rows)}/{len(files)}] {row['file']}: {row['status']}", file=sys.stderr)
+    rows.sort(key=lambda r: r["file"])
+
+    with open(os.path.join(out_dir, "summary.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of survey workbooks")
+    parser.add_argument("input_dir", help="directory with " + "/".join(UPLOAD_TYPES) + " files")
+    parser.add_argument("-o", "--output-dir", default="results", help="where JSON results and summary.csv go")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--pair", nargs=2, action="append", default=[], metavar=("VAR1", "VAR2"),
+                        help="extra column pair for auto association; repeatable")
+    parser.add_argument("--scale", action="append", default=[], metavar="NAME=ITEM1,ITEM2",
+                        help="scale to score instead of X_TOTAL/Y_TOTAL; repeatable")
+    parser.add_argument("--reverse", action="append", default=[], metavar="ITEM",
+                        help="reverse-coded item; repeatable")
+    parser.add_argument("--scoring", choices=SCORING_METHODS, default="sum", help="scale score method")
+    parser.add_argument("--min-answered", type=int, default=1,
+                        help="fewest answered items for a scale score (default: 1)")
+    parser.add_argument("--scale-min", type=float, default=None,
+                        help="lowest response option, used to mirror reverse-coded items")
+    parser.add_argument("--scale-max", type=float, default=None,
+                        help="highest response option (default without both: each item's observed range)")
+    args = parser.parse_args(argv)
+
+    if (args.scale_min is None) != (args.scale_max is None):
+        parser.error("--scale-min and --scale-max must be given together")
+    scoring = {"reverse": args.reverse, "method": args.scoring, "min_answered": args.min_answered}
+    if args.scale_min is not None:
+        if args.scale_min >= args.scale_max:
+            parser.error("--scale-min must be below --scale-max")
+        scoring["scale_range"] = (args.scale_min, args.scale_max)
+    for spec in args.scale:
+        name, sep, items = spec.partition("=")
+        if not sep or not name.strip():
+            parser.error(f"--scale expects NAME=ITEM1,ITEM2, got {spec!r}")
+    scoring["scale_text"] = "\n".join(args.scale)
+    rows = run_batch(args.input_dir, args.output_dir, args.workers, [tuple(p) for p in args.pair], scoring)
+    failed = sum(r["status"] != "ok" for r in rows)
+    print(f"{len(rows) - failed} analyzed, {failed} failed -> {args.output_dir}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
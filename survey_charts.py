@@ -0,0 +1,378 @@
+import io
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from survey_data import ByteLRUCache
+
+# -------------------------
+# CHART BUILDERS
+# -------------------------
+# Figures are built with the object-oriented Figure API and returned to the
+# caller, which decides how to show them (st.image of PNG bytes, ...). Each
+# figure gets its own Agg canvas and pyplot is never imported, so there is no
+# global figure manager: sessions on different threads and pool workers can
+# render at the same time without sharing state.
+
+PLOT_FIGSIZE = (6, 3)
+PLOT_DPI = 100
+GRID_COLUMNS = 3
+SCATTER_FIGSIZE = (8, 5)
+ASSOC_SCATTER_FIGSIZE = (10, 6)
+
+SCATTER_MODES = ["auto", "points", "counts", "density"]
+SCATTER_MAX_POINTS = 5000     # "auto" draws every point up to this many pairs
+SCATTER_GRID_LEVELS = 15      # both axes with at most this many values form a grid (Likert)
+SCATTER_STRATA = 10           # strata per axis for downsampling
+SCATTER_SAMPLE_SEED = 0
+HEXBIN_GRIDSIZE = 40
+
+PNG_DPI = 200  # what st.pyplot uses, so cached images look the same
+CHART_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256 MB of encoded PNGs
+CHART_WORKERS = min(8, os.cpu_count() or 1)
+PARALLEL_MIN_CHARTS = 4  # fewer cache misses than this are rendered inline
+
+HEATMAP_CMAPS = ["RdBu_r", "coolwarm", "PuOr_r", "viridis"]
+HEATMAP_ANNOTATE_MAX = 15   # write r into the cells up to this many columns
+HEATMAP_LABEL_MAX = 60      # beyond this only every n-th label is shown
+
+
+def new_figure(figsize=PLOT_FIGSIZE, dpi=PLOT_DPI):
+    """Figure bound to its own Agg canvas, independent of pyplot"""
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def heatmap_figsize(k):
+    """Figure size correlation_heatmap_figure uses for a k x k matrix"""
+    side = min(4 + 0.3 * k, 18)
+    return (side + 1.5, side)
+
+
+def correlation_heatmap_figure(r, p=None, alpha=None, order=None, title="", cmap="RdBu_r"):
+    """One heatmap figure for a correlation matrix (DataFrame)
+
+    With alpha set, cells whose p-value is not below it are blanked. order is
+    an optional column permutation, e.g. from survey_engine.cluster_order.
+    The whole matrix is a single image, so cost barely grows with columns.
+    """
+    labels = [str(c) for c in r.columns]
+    R = r.to_numpy(dtype=float)
+    P = None if p is None else p.to_numpy(dtype=float)
+    if order is not None:
+        R = R[np.ix_(order, order)]
+        labels = [labels[i] for i in order]
+        if P is not None:
+            P = P[np.ix_(order, order)]
+    if P is not None and alpha is not None:
+        R = np.where(P < alpha, R, np.nan)
+    k = len(labels)
+
+    fig = new_figure(heatmap_figsize(k), dpi=100)
+    ax = fig.add_subplot()
+    colormap = matplotlib.colormaps[cmap].copy()
+    colormap.set_bad('#E5E7EB')
+    image = ax.imshow(np.ma.masked_invalid(R), cmap=colormap, vmin=-1, vmax=1, interpolation='nearest')
+    fig.colorbar(image, ax=ax, fraction=0.046, pad=0.04)
+
+    step = int(np.ceil(k / HEATMAP_LABEL_MAX)) if k > HEATMAP_LABEL_MAX else 1
+    ticks = np.arange(0, k, step)
+    fontsize = max(5, min(9, 300 / max(k, 1)))
+    ax.set_xticks(ticks)
+    ax.set_xticklabels([labels[i] for i in ticks], rotation=90, fontsize=fontsize)
+    ax.set_yticks(ticks)
+    ax.set_yticklabels([labels[i] for i in ticks], fontsize=fontsize)
+
+    if k <= HEATMAP_ANNOTATE_MAX:
+        for i in range(k):
+            for j in range(k):
+                if not np.isnan(R[i, j]):
+                    ax.text(j, i, f"{R[i, j]:.2f}", ha='center', va='center', fontsize=7,
+                            color='white' if abs(R[i, j]) > 0.6 else 'black')
+
+    ax.set_title(title, fontsize=12, fontweight='bold')
+    fig.tight_layout()
+    return fig
+
+
+def plot_barh(ax, counts, max_bars=20):
+    """Plot a frequency table as horizontal bars with error handling
+
+    counts is a table from survey_engine.frequency_tables (sorted by value).
+    Laid out like pandas' Series.plot(kind='barh') but drawn on ax directly,
+    since pandas plotting goes through pyplot.
+    """
+    try:
+        if len(counts) == 0:
+            ax.text(0.5, 0.5, "No data", ha='center', va='center', fontsize=10, color='red')
+            return
+
+        if len(counts) > max_bars:
+            counts = counts.nlargest(max_bars).sort_index(na_position='last')
+        pos = np.arange(len(counts))
+        ax.barh(pos, counts.to_numpy(), 0.5, color='#667eea')
+        ax.set_ylim(-0.5, len(counts) - 0.5)
+        ax.set_yticks(pos)
+        ax.set_yticklabels([str(v) for v in counts.index])
+        if counts.index.name is not None:
+            ax.set_ylabel(str(counts.index.name))
+    except Exception as e:
+        ax.text(0.5, 0.5, f"Error: {str(e)[:30]}", ha='center', va='center', fontsize=9, color='red')
+
+
+def plot_hist(ax, histogram):
+    """Draw precomputed (counts, edges) histogram bars"""
+    counts, edges = histogram
+    ax.hist(edges[:-1], bins=edges, weights=counts, edgecolor='black', alpha=0.7, color='#764ba2')
+
+
+def draw_chart(ax, kind, source, col_name):
+    """Draw one item panel; kind is "bar" or "hist"
+
+    source maps column names to frequency tables for "bar" and to
+    (counts, edges) histograms for "hist", see survey_engine.
+    """
+    try:
+        if kind == "bar":
+            plot_barh(ax, source[col_name])
+        else:
+            histogram = source[col_name]
+            if histogram is None:
+                raise ValueError("no numeric data")
+            plot_hist(ax, histogram)
+        ax.set_title(col_name, fontsize=10, fontweight='bold')
+        ax.tick_params(axis='both', labelsize=8)
+    except Exception:
+        message = "Chart error" if kind == "bar" else "No numeric data"
+        ax.text(0.5, 0.5, message, ha='center', va='center', fontsize=10, color='red')
+
+
+def chart_figure(kind, source, col_name, figsize=PLOT_FIGSIZE, dpi=PLOT_DPI):
+    """Single-panel figure for one column"""
+    fig = new_figure(figsize, dpi)
+    draw_chart(fig.add_subplot(), kind, source, col_name)
+    fig.tight_layout()
+    return fig
+
+
+def chart_grid_figure(kind, source, cols, ncols=GRID_COLUMNS, panel_size=PLOT_FIGSIZE, dpi=PLOT_DPI):
+    """All columns of a group as panels of one subplot grid
+
+    One figure, one layout pass and one PNG per group instead of one per
+    column.
+    """
+    ncols = max(1, min(ncols, len(cols)))
+    nrows = math.ceil(len(cols) / ncols)
+    fig = new_figure((panel_size[0] * ncols, panel_size[1] * nrows), dpi)
+    axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+    for ax, col_name in zip(axes, cols):
+        draw_chart(ax, kind, source, col_name)
+    for ax in axes[len(cols):]:
+        fig.delaxes(ax)
+    fig.tight_layout()
+    return fig
+
+
+def scatter_style(x, y, mode="auto"):
+    """Resolve mode "auto" to "points", "counts" or "density" for paired arrays
+
+    Up to SCATTER_MAX_POINTS pairs every point is drawn. Above that, data on
+    a small grid (Likert items on both axes) gets one marker per cell sized
+    by its count, anything else a hexbin density. A requested "counts" view
+    of data off the grid falls back to "density" too, since a marker per
+    distinct pair is no summary at all.
+    """
+    if mode == "auto" and len(x) <= SCATTER_MAX_POINTS:
+        return "points"
+    if mode in ("auto", "counts"):
+        on_grid = len(np.unique(x)) <= SCATTER_GRID_LEVELS and len(np.unique(y)) <= SCATTER_GRID_LEVELS
+        return "counts" if on_grid else "density"
+    return mode
+
+
+def downsample_pairs(x, y, max_points=SCATTER_MAX_POINTS, strata=SCATTER_STRATA, seed=SCATTER_SAMPLE_SEED):
+    """Seeded sample of about max_points pairs, stratified on a strata x strata grid
+
+    Every occupied cell keeps at least one pair, so sparse regions and
+    outliers survive; the rest of the budget is shared out by cell size.
+    """
+    n = len(x)
+    if n <= max_points:
+        return x, y
+
+    def cells(v):
+        edges = np.linspace(v.min(), v.max(), strata + 1)[1:-1]
+        return np.searchsorted(edges, v, side='right')
+
+    cell = cells(x) * strata + cells(y)
+    rng = np.random.default_rng(seed)
+    # Random order, then stable sort by cell: each cell's pairs come out shuffled
+    order = rng.permutation(n)
+    order = order[np.argsort(cell[order], kind='stable')]
+    sizes = np.bincount(cell, minlength=strata * strata)
+    quota = np.maximum(np.floor(sizes * (max_points / n)), sizes > 0).astype(np.int64)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(n) - np.repeat(starts, sizes)
+    keep = np.sort(order[rank < np.repeat(quota, sizes)])
+    return x[keep], y[keep]
+
+
+def draw_scatter(ax, x, y, style, **point_style):
+    """Scatter of paired arrays in a style from scatter_style"""
+    if style == "counts":
+        # Only occupied cells are counted, never a dense x-levels by y-levels grid
+        cells, c = np.unique(np.column_stack([x, y]), axis=0, return_counts=True)
+        cx, cy = cells[:, 0], cells[:, 1]
+        ax.scatter(cx, cy, s=30 + 900 * c / c.max(), alpha=0.6,
+                   color=point_style.get('color', '#667eea'), edgecolors='black', linewidth=0.5)
+        if len(c) <= 100:
+            for px, py, count in zip(cx, cy, c):
+                ax.annotate(f"{count:,}", (px, py), ha='center', va='center', fontsize=7)
+    elif style == "density":
+        # Log colour scale so single respondents in the tails stay visible
+        hb = ax.hexbin(x, y, gridsize=HEXBIN_GRIDSIZE, cmap='Purples', mincnt=1, bins='log')
+        ax.figure.colorbar(hb, ax=ax, label="n (log)")
+    else:
+        x, y = downsample_pairs(x, y)
+        ax.scatter(x, y, **point_style)
+
+
+def scatter_figure(x, y, xlabel, ylabel, title, style="points", figsize=SCATTER_FIGSIZE, dpi=PLOT_DPI):
+    """Scatter plot of two paired arrays"""
+    fig = new_figure(figsize, dpi)
+    ax = fig.add_subplot()
+    draw_scatter(ax, x, y, style, alpha=0.6, edgecolors='black', linewidth=0.5, color='#667eea')
+    ax.set_xlabel(xlabel, fontsize=10)
+    ax.set_ylabel(ylabel, fontsize=10)
+    ax.set_title(title, fontsize=11, fontweight='bold')
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    return fig
+
+
+def association_figure(x, y, xlabel, ylabel, title, note="", fit_line=False, style="points",
+                       figsize=ASSOC_SCATTER_FIGSIZE, dpi=PLOT_DPI):
+    """Auto-association scatter with an optional least-squares line and a note box"""
+    fig = new_figure(figsize, dpi)
+    ax = fig.add_subplot()
+    draw_scatter(ax, x, y, style, alpha=0.7, color='#667eea', s=60, edgecolors='white', linewidth=0.5)
+
+    if fit_line:
+        # Fitted on every pair; a straight line only needs its two ends
+        line = np.poly1d(np.polyfit(x, y, 1))
+        ends = np.array([x.min(), x.max()])
+        ax.plot(ends, line(ends), color='#764ba2', linewidth=2, linestyle='--', alpha=0.8)
+
+    ax.set_xlabel(xlabel, fontsize=12, fontweight='bold')
+    ax.set_ylabel(ylabel, fontsize=12, fontweight='bold')
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.grid(True, alpha=0.3, linestyle='--')
+    if note:
+        ax.annotate(note, xy=(0.05, 0.95), xycoords='axes fraction',
+                    fontsize=10, bbox=dict(boxstyle="round,pad=0.3", facecolor="white", alpha=0.8))
+    fig.tight_layout()
+    return fig
+
+
+# -------------------------
+# RENDERED CHART CACHE
+# -------------------------
+# Finished charts are kept as encoded PNG bytes keyed by what they depend on:
+# a fingerprint of the plotted data, the chart kind, size/DPI, the language of
+# any translated text and kind-specific options. A hit is served straight to
+# st.image without touching matplotlib.
+
+class ChartCache(ByteLRUCache):
+    """LRU cache of encoded PNG bytes bounded by total size"""
+
+    def __init__(self, max_bytes=CHART_CACHE_MAX_BYTES):
+        super().__init__(max_bytes)
+
+    def entry_size(self, entry):
+        return len(entry)
+
+
+def chart_key(fingerprint, kind, figsize, language="", options=(), dpi=PNG_DPI):
+    """Cache key for a rendered chart; pass language only if the chart has translated text"""
+    return (fingerprint, kind, tuple(figsize), dpi, language, tuple(options))
+
+
+def figure_png(fig, dpi=PNG_DPI):
+    """Encode a figure as PNG bytes the way st.pyplot does"""
+    if not isinstance(fig.canvas, FigureCanvasAgg):
+        FigureCanvasAgg(fig)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+    return buf.getvalue()
+
+
+def cached_png(cache, key, build, dpi=PNG_DPI):
+    """PNG bytes for key, calling build() for a Figure only on a cache miss"""
+    png = cache.get(key)
+    if png is None:
+        png = cache.put(key, figure_png(build(), dpi=dpi))
+    return png
+
+
+# -------------------------
+# PARALLEL RENDERING
+# -------------------------
+# A job is (builder, args, kwargs) where builder is a module-level function
+# returning a Figure, so jobs pickle cleanly into worker processes. Workers
+# only build and encode; the page inserts the returned bytes in job order.
+
+def make_chart_pool(workers=CHART_WORKERS):
+    """Process pool for chart rendering, or None on a single core
+
+    Workers are spawned rather than forked so they never inherit the
+    server's threads or locks.
+    """
+    if workers < 2:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def render_png(builder, args=(), kwargs=None, dpi=PNG_DPI):
+    """Build one figure and encode it; the pool worker entry point"""
+    return figure_png(builder(*args, **(kwargs or {})), dpi=dpi)
+
+
+def iter_render_pngs(jobs, pool=None, dpi=PNG_DPI):
+    """Yield (job index, PNG bytes) as each job finishes, on pool when it pays off"""
+    done = set()
+    if pool is not None and len(jobs) >= PARALLEL_MIN_CHARTS:
+        try:
+            futures = {pool.submit(render_png, builder, args, kwargs, dpi): i
+                       for i, (builder, args, kwargs) in enumerate(jobs)}
+            for future in as_completed(futures):
+                png = future.result()
+                done.add(futures[future])
+                yield futures[future], png
+        except BrokenProcessPool:
+            pass  # a worker died; render the rest here
+    for i, (builder, args, kwargs) in enumerate(jobs):
+        if i not in done:
+            yield i, render_png(builder, args, kwargs, dpi)
+
+
+def iter_cached_pngs(cache, keyed_jobs, pool=None, dpi=PNG_DPI):
+    """Yield (index, PNG bytes) for (key, job) pairs: cache hits first, then
+    the rendered misses in completion order"""
+    missing = []
+    for i, (key, _) in enumerate(keyed_jobs):
+        png = cache.get(key)
+        if png is None:
+            missing.append(i)
+        else:
+            yield i, png
+    for j, png in iter_render_pngs([keyed_jobs[i][1] for i in missing], pool, dpi):
+        i = missing[j]
+        yield i, cache.put(keyed_jobs[i][0], png)
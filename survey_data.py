@@ -0,0 +1,620 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# DATASET LOADING LAYER
+# -------------------------
+# Workbooks are parsed once per unique content and shared between reruns and
+# sessions. Entries are keyed by a fingerprint of the uploaded bytes, so the
+# same file uploaded twice (or by two analysts) is only parsed once.
+
+DATASET_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+NUMERIC_RATIO_THRESHOLD = 0.5
+# Text columns are screened on a sample before any full to_numeric pass; a
+# sample this far below the threshold is treated as clearly textual
+TYPE_SAMPLE_SIZE = 1000
+TYPE_SAMPLE_MARGIN = 0.1
+# Text columns with at most this share of distinct answers become category
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+# Nullable integer dtypes tried in order when compacting whole-number columns
+COMPACT_INT_DTYPES = [
+    ("UInt8", 0, 255),
+    ("Int8", -128, 127),
+    ("UInt16", 0, 65535),
+    ("Int16", -32768, 32767),
+    ("Int32", -2 ** 31, 2 ** 31 - 1),
+]
+
+# On-disk columnar copies of parsed uploads, reloaded with np.load(mmap_mode)
+SIDECAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".survey_cache")
+SIDECAR_MAX_BYTES = 10 * 1024 * 1024 * 1024  # 10 GB
+SIDECAR_VERSION = 3
+
+# Uploads at least this big are streamed row by row instead of pd.read_excel
+STREAMING_MIN_BYTES = 20 * 1024 * 1024  # 20 MB
+# Cells held as Python objects before a block is converted to typed columns
+STREAM_BLOCK_CELLS = 1_000_000
+# Rows per pd.read_csv chunk for CSV/TSV uploads
+DELIMITED_CHUNK_ROWS = 50_000
+
+EXCEL_EXTENSIONS = (".xlsx", ".xls")
+DELIMITED_EXTENSIONS = (".csv", ".tsv", ".tab", ".txt")
+# Every extension read_table parses, for the uploaders and batch file discovery
+UPLOAD_TYPES = [ext[1:] for ext in EXCEL_EXTENSIONS + DELIMITED_EXTENSIONS] + ["gz", "zip"]
+
+# Same default missing-value markers pd.read_excel uses
+NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+    'n/a', 'nan', 'null',
+}
+
+
+def fingerprint_bytes(data):
+    """Return a stable content hash for raw file bytes"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def array_fingerprint(*arrays):
+    """Content hash of one or more NumPy arrays (values, dtype and shape)"""
+    h = hashlib.blake2b(digest_size=16)
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(f"{a.dtype.str}{a.shape}".encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def frame_fingerprint(frame):
+    """Content hash of a DataFrame's labels, dtypes and values (index ignored)"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr([(str(c), str(t)) for c, t in frame.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def frame_nbytes(df):
+    """Approximate in-memory size of a DataFrame in bytes"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def format_bytes(n):
+    """Human-readable byte count"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def dataset_nbytes(raw, df, maybe_numeric):
+    """Bytes held by a raw/coerced frame pair, counting shared columns once"""
+    return frame_nbytes(raw) + sum(
+        int(df[c].memory_usage(index=False, deep=True))
+        for c in maybe_numeric if raw[c].dtype != df[c].dtype
+    )
+
+
+def column_kind(series):
+    """Inferred type label: numeric, boolean, datetime, text or empty"""
+    if not series.notna().any():
+        return 'empty'
+    if pd.api.types.is_bool_dtype(series):
+        return 'boolean'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    return 'text'
+
+
+def coerce_numeric_columns(df, threshold=NUMERIC_RATIO_THRESHOLD, sample_size=TYPE_SAMPLE_SIZE):
+    """Convert mostly-numeric columns; return (df, maybe_numeric, column_types)
+
+    Text columns are judged first on a fixed-seed random sample and skipped
+    without a full pd.to_numeric pass when the sample is clearly below the
+    threshold. Every column that is coerced is still accepted or rejected on
+    its exact numeric ratio.
+    """
+    # Shallow copy: only replaced columns get new buffers, the rest are shared
+    df = df.copy(deep=False)
+    n = len(df)
+    sample_idx = None
+    if n > sample_size:
+        rng = np.random.default_rng(0)
+        sample_idx = np.sort(rng.choice(n, size=sample_size, replace=False))
+
+    maybe_numeric = []
+    column_types = {}
+    for col in df.columns:
+        series = df[col]
+        try:
+            if series.dtype == object and sample_idx is not None:
+                sample = pd.to_numeric(series.iloc[sample_idx], errors='coerce')
+                if sample.notna().mean() < threshold - TYPE_SAMPLE_MARGIN:
+                    column_types[col] = column_kind(series)
+                    continue
+            coerced = pd.to_numeric(series, errors='coerce')
+            non_na_ratio = coerced.notna().sum() / max(len(coerced), 1)
+            if non_na_ratio >= threshold:
+                df[col] = coerced
+                maybe_numeric.append(col)
+        except Exception:
+            pass
+        column_types[col] = column_kind(df[col])
+    return df, maybe_numeric, column_types
+
+
+# -------------------------
+# DTYPE COMPACTION
+# -------------------------
+def compact_series(series):
+    """Return the series in the smallest dtype that holds its values exactly
+
+    Whole-number columns (Likert items, counts) move to nullable UInt8/Int8
+    and up; text columns with repeated answers move to category. Anything
+    else is returned unchanged.
+    """
+    if series.dtype == object:
+        non_null = series.count()
+        if non_null and series.nunique(dropna=True) <= non_null * CATEGORY_MAX_UNIQUE_RATIO:
+            return series.astype('category')
+        return series
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        return series
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    finite = values[~np.isnan(values)]
+    if len(finite) == 0 or not np.array_equal(finite, np.round(finite)):
+        return series
+    lo, hi = finite.min(), finite.max()
+    for dtype, dmin, dmax in COMPACT_INT_DTYPES:
+        if lo >= dmin and hi <= dmax:
+            if series.dtype == dtype:
+                return series
+            return series.astype(dtype)
+    return series
+
+
+def compact_frames(raw, df, maybe_numeric):
+    """Compact both frames of a dataset; return (raw, df, (bytes_before, bytes_after))
+
+    Columns that coercion left unchanged keep pointing at one shared compact
+    array, so the preview frame costs nothing extra for them.
+    """
+    before = dataset_nbytes(raw, df, maybe_numeric)
+    raw = raw.copy(deep=False)
+    df = df.copy(deep=False)
+    coerced = set(maybe_numeric)
+    for col in df.columns:
+        shared = col not in coerced or raw[col].dtype == df[col].dtype
+        df[col] = compact_series(df[col])
+        raw[col] = df[col] if shared else compact_series(raw[col])
+    after = dataset_nbytes(raw, df, maybe_numeric)
+    return raw, df, (before, after)
+
+
+class SurveyDataset:
+    """Parsed upload: raw frame for preview plus the coerced analysis frame"""
+
+    def __init__(self, key, name, raw, df, maybe_numeric, column_types=None, memory_report=None):
+        self.key = key
+        self.name = name
+        self.raw = raw
+        self.df = df
+        self.maybe_numeric = maybe_numeric
+        if column_types is None:
+            column_types = {col: column_kind(df[col]) for col in df.columns}
+        self.column_types = column_types
+        self.nbytes = dataset_nbytes(raw, df, maybe_numeric)
+        # (bytes before compaction, bytes after) or None if never compacted
+        self.memory_report = memory_report
+
+    @property
+    def numeric_cols(self):
+        return self.columns_of_type('numeric')
+
+    def columns_of_type(self, kind):
+        return [col for col in self.df.columns if self.column_types.get(col) == kind]
+
+
+class ByteLRUCache:
+    """Thread-safe LRU cache bounded by the total size of its entries"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def entry_size(self, entry):
+        return entry.nbytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= self.entry_size(old)
+            # Entries larger than the whole budget are returned but not kept
+            size = self.entry_size(entry)
+            if size > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= self.entry_size(evicted)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+class DatasetCache(ByteLRUCache):
+    """LRU cache of SurveyDataset objects bounded by their in-memory size"""
+
+    def __init__(self, max_bytes=DATASET_CACHE_MAX_BYTES):
+        super().__init__(max_bytes)
+
+
+# -------------------------
+# COLUMNAR SIDECAR STORE
+# -------------------------
+# Layout of <SIDECAR_DIR>/<key>/:
+#   manifest.json   row count, column specs, inferred types, coerced columns
+#   columns.npy     column labels (object array, labels need not be str)
+#   c<i>.npy        values of column i in the coerced frame (+ _m mask, _u labels)
+#   r<i>.npy        raw values of column i, only when coercion changed them
+# Numeric columns are stored as plain arrays (nullable ones with a separate
+# mask) and memory-mapped on reload, so only the pages the analysis touches
+# are read. Category columns keep their codes; other text columns are stored
+# as int32 codes plus a small table of unique values.
+
+MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+def _save_column(dirpath, stem, series):
+    """Write one column and return its manifest spec"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        np.save(os.path.join(dirpath, stem + ".npy"), series.cat.codes.to_numpy())
+        np.save(os.path.join(dirpath, stem + "_u.npy"), np.asarray(series.cat.categories, dtype=object), allow_pickle=True)
+        return {"file": stem, "kind": "category"}
+    if isinstance(series.array, MASKED_ARRAYS):
+        data = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+        np.save(os.path.join(dirpath, stem + ".npy"), data)
+        np.save(os.path.join(dirpath, stem + "_m.npy"), series.isna().to_numpy())
+        return {"file": stem, "kind": "masked", "dtype": str(series.dtype)}
+    values = series.to_numpy()
+    if values.dtype == object:
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        np.save(os.path.join(dirpath, stem + ".npy"), codes.astype(np.int32))
+        np.save(os.path.join(dirpath, stem + "_u.npy"), np.asarray(uniques, dtype=object), allow_pickle=True)
+        return {"file": stem, "kind": "codes"}
+    np.save(os.path.join(dirpath, stem + ".npy"), values)
+    return {"file": stem, "kind": "values"}
+
+
+def _load_column(dirpath, spec):
+    """Read one column written by _save_column"""
+    values = np.load(os.path.join(dirpath, spec["file"] + ".npy"), mmap_mode='r')
+    if spec["kind"] == "values":
+        return values
+    if spec["kind"] == "masked":
+        mask = np.load(os.path.join(dirpath, spec["file"] + "_m.npy"), mmap_mode='r')
+        array_type = pd.api.types.pandas_dtype(spec["dtype"]).construct_array_type()
+        return array_type(values, mask, copy=False)
+    if spec["kind"] == "category":
+        categories = np.load(os.path.join(dirpath, spec["file"] + "_u.npy"), allow_pickle=True)
+        return pd.Categorical.from_codes(values, categories=categories)
+    uniques = np.load(os.path.join(dirpath, spec["file"] + "_u.npy"), allow_pickle=True)
+    out = np.empty(len(values), dtype=object)
+    missing = values < 0
+    out[~missing] = uniques[values[~missing]]
+    out[missing] = np.nan
+    return out
+
+
+def sidecar_path(key, root=None):
+    return os.path.join(root or SIDECAR_DIR, key)
+
+
+def save_sidecar(dataset, root=None):
+    """Persist a parsed dataset as per-column .npy files; return success"""
+    root = root or SIDECAR_DIR
+    final = sidecar_path(dataset.key, root)
+    if os.path.isdir(final):
+        return True
+    try:
+        os.makedirs(root, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=root)
+        try:
+            coerced = set(dataset.maybe_numeric)
+            columns = list(dataset.df.columns)
+            specs = []
+            for i, col in enumerate(columns):
+                spec = _save_column(tmp, f"c{i}", dataset.df[col])
+                if col in coerced and dataset.raw[col].dtype != dataset.df[col].dtype:
+                    spec["raw"] = _save_column(tmp, f"r{i}", dataset.raw[col])
+                specs.append(spec)
+            np.save(os.path.join(tmp, "columns.npy"), np.asarray(columns, dtype=object), allow_pickle=True)
+            manifest = {
+                "version": SIDECAR_VERSION,
+                "name": dataset.name,
+                "rows": len(dataset.df),
+                "columns": specs,
+                "maybe_numeric": [i for i, col in enumerate(columns) if col in coerced],
+                "column_types": [dataset.column_types[col] for col in columns],
+                "memory_report": dataset.memory_report,
+            }
+            with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp, final)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+    except Exception:
+        # Another session may have written the same key first
+        return os.path.isdir(final)
+    prune_sidecars(root)
+    return True
+
+
+def load_sidecar(key, root=None):
+    """Rebuild a SurveyDataset from disk without parsing, or return None"""
+    dirpath = sidecar_path(key, root)
+    try:
+        with open(os.path.join(dirpath, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != SIDECAR_VERSION:
+            return None
+        columns = list(np.load(os.path.join(dirpath, "columns.npy"), allow_pickle=True))
+        data = {}
+        raw_data = {}
+        for col, spec in zip(columns, manifest["columns"]):
+            data[col] = _load_column(dirpath, spec)
+            raw_data[col] = _load_column(dirpath, spec["raw"]) if "raw" in spec else data[col]
+        index = pd.RangeIndex(manifest["rows"])
+        df = pd.DataFrame(data, index=index, columns=columns, copy=False)
+        raw = pd.DataFrame(raw_data, index=index, columns=columns, copy=False)
+        os.utime(dirpath)
+    except Exception:
+        return None
+    maybe_numeric = [columns[i] for i in manifest["maybe_numeric"]]
+    column_types = dict(zip(columns, manifest["column_types"]))
+    memory_report = manifest.get("memory_report")
+    return SurveyDataset(
+        key, manifest.get("name", ""), raw, df, maybe_numeric, column_types,
+        memory_report=tuple(memory_report) if memory_report else None,
+    )
+
+
+def prune_sidecars(root=None, max_bytes=SIDECAR_MAX_BYTES):
+    """Delete least recently used sidecars until the store fits max_bytes"""
+    root = root or SIDECAR_DIR
+    entries = []
+    for entry in os.scandir(root):
+        if not entry.is_dir() or entry.name.startswith("."):
+            continue
+        size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+        entries.append((entry.stat().st_mtime, size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+# -------------------------
+# STREAMING XLSX READER
+# -------------------------
+def _header_names(row):
+    """Column labels as pd.read_excel names them (Unnamed: i, X.1 for repeats)"""
+    names = []
+    seen = {}
+    for i, value in enumerate(row):
+        if value is None or (isinstance(value, str) and value.strip() == ""):
+            value = f"Unnamed: {i}"
+        if value in seen:
+            seen[value] += 1
+            value = f"{value}.{seen[value]}"
+        seen.setdefault(value, 0)
+        names.append(value)
+    return names
+
+
+def _typed_block(rows, names):
+    """Convert a block of row tuples into typed columns"""
+    block = pd.DataFrame.from_records(rows, columns=names, coerce_float=True)
+    for col in block.columns[block.dtypes == object]:
+        values = block[col]
+        is_na = values.isna() | values.isin(NA_STRINGS)
+        if is_na.any():
+            values = values.mask(is_na)
+        values = values.infer_objects()
+        if values.dtype == object:
+            # Numbers stored as text become numeric, as in pd.read_excel
+            try:
+                values = pd.to_numeric(values)
+            except (ValueError, TypeError):
+                pass
+        block[col] = values
+    return block
+
+
+def stream_excel(data, progress=None, block_cells=STREAM_BLOCK_CELLS):
+    """Read the first sheet of an XLSX file in read-only mode, block by block
+
+    Rows are pulled from openpyxl's streaming reader and converted to typed
+    columns every few thousand rows, so peak memory stays close to the size
+    of the final frame. progress(rows_done, total_rows) is called per block;
+    total_rows is None when the sheet does not declare its dimensions.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        total_rows = ws.max_row - 1 if ws.max_row else None
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        names = _header_names(header)
+        width = len(names)
+        block_rows = max(1000, block_cells // max(width, 1))
+
+        blocks = []
+        pending = []
+        done = 0
+        blank = (None,) * width
+        blank_run = 0
+        for row in rows:
+            # Blank rows are kept as NaN rows, except trailing ones
+            if all(v is None for v in row):
+                blank_run += 1
+                continue
+            if blank_run:
+                pending.extend([blank] * blank_run)
+                blank_run = 0
+            if len(row) != width:
+                row = (tuple(row) + blank)[:width]
+            pending.append(row)
+            if len(pending) >= block_rows:
+                blocks.append(_typed_block(pending, names))
+                done += len(pending)
+                pending = []
+                if progress is not None:
+                    progress(done, total_rows)
+        if pending or not blocks:
+            blocks.append(_typed_block(pending, names))
+            done += len(pending)
+        if progress is not None:
+            progress(done, done)
+    finally:
+        wb.close()
+
+    if len(blocks) == 1:
+        return blocks[0]
+    return pd.concat(blocks, ignore_index=True, copy=False)
+
+
+# -------------------------
+# CSV / TSV / COMPRESSED UPLOADS
+# -------------------------
+def _sniff_delimiter(name, head):
+    """Pick the field separator from the file name, else from the header line"""
+    lower = name.lower()
+    if lower.endswith((".tsv", ".tab")):
+        return "\t"
+    if lower.endswith(".csv"):
+        return ","
+    first = head.split(b"\n", 1)[0]
+    return "\t" if first.count(b"\t") > first.count(b",") else ","
+
+
+def _zip_member(archive):
+    """First data file in a zip archive, skipping folders and macOS metadata"""
+    for info in archive.infolist():
+        if info.is_dir() or info.filename.startswith("__MACOSX/"):
+            continue
+        return info
+    raise ValueError("zip archive contains no files")
+
+
+def read_delimited(open_stream, sep, progress=None, chunk_rows=DELIMITED_CHUNK_ROWS):
+    """Parse a CSV/TSV stream in chunks; open_stream() returns a fresh binary stream
+
+    UTF-8 (with or without BOM) is tried first and Latin-1 as a fallback,
+    which covers the exports of every survey platform we have seen.
+    """
+    for encoding in ("utf-8-sig", "latin-1"):
+        chunks = []
+        done = 0
+        try:
+            with open_stream() as stream:
+                reader = pd.read_csv(stream, sep=sep, encoding=encoding, chunksize=chunk_rows)
+                for chunk in reader:
+                    chunks.append(chunk)
+                    done += len(chunk)
+                    if progress is not None:
+                        progress(done, None)
+        except UnicodeDecodeError:
+            continue
+        break
+    if progress is not None:
+        progress(done, done)
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True, copy=False)
+
+
+def read_table(data, name="", progress=None):
+    """Parse raw upload bytes (Excel, CSV/TSV/TXT, optionally gzip/zip) into a DataFrame"""
+    lower = name.lower()
+    if lower.endswith(".gz"):
+        inner = name[:-3]
+        if inner.lower().endswith(EXCEL_EXTENSIONS):
+            return read_table(gzip.decompress(data), inner, progress)
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as f:
+            sep = _sniff_delimiter(inner, f.read(64 * 1024))
+        return read_delimited(lambda: gzip.GzipFile(fileobj=io.BytesIO(data)), sep, progress)
+
+    if lower.endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            member = _zip_member(archive)
+            if member.filename.lower().endswith(EXCEL_EXTENSIONS):
+                return read_table(archive.read(member), member.filename, progress)
+            with archive.open(member) as f:
+                sep = _sniff_delimiter(member.filename, f.read(64 * 1024))
+            return read_delimited(lambda: archive.open(member), sep, progress)
+
+    if lower.endswith(DELIMITED_EXTENSIONS):
+        sep = _sniff_delimiter(name, data[:64 * 1024])
+        return read_delimited(lambda: io.BytesIO(data), sep, progress)
+
+    if lower.endswith(".xlsx") and len(data) >= STREAMING_MIN_BYTES:
+        return stream_excel(data, progress=progress)
+    return pd.read_excel(io.BytesIO(data))
+
+
+def load_dataset(data, cache, name="", key=None, sidecar_dir=None, progress=None):
+    """Return the SurveyDataset for these bytes, parsing only on a cache miss"""
+    if key is None:
+        key = fingerprint_bytes(data)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    entry = load_sidecar(key, sidecar_dir)
+    if entry is None:
+        raw = read_table(data, name, progress=progress)
+        df, maybe_numeric, column_types = coerce_numeric_columns(raw)
+        raw, df, memory_report = compact_frames(raw, df, maybe_numeric)
+        entry = SurveyDataset(key, name, raw, df, maybe_numeric, column_types, memory_report)
+        if not raw.empty:
+            save_sidecar(entry, sidecar_dir)
+    return cache.put(key, entry)
@@ -0,0 +1,919 @@
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import leaves_list, linkage
+from scipy.spatial.distance import squareform
+from scipy.stats import beta, normaltest, pearsonr, rankdata, shapiro, spearmanr
+from scipy.stats import t as t_dist
+
+from survey_data import ByteLRUCache, array_fingerprint, frame_fingerprint
+
+# -------------------------
+# ANALYSIS ENGINE
+# -------------------------
+# Pure functions over DataFrames and NumPy arrays shared by st13.py, st17.py
+# and batch jobs. Nothing here touches Streamlit, so results can be cached,
+# profiled and reused outside the page. Loading and numeric coercion live in
+# survey_data.py.
+
+NORMALITY_ALPHA = 0.05
+SHAPIRO_MAX_N = 5000             # scipy's Shapiro-Wilk p-value is only accurate up to here
+NORMALITY_MAX_SAMPLE = 100_000   # larger columns are tested on a seeded subsample
+NORMALITY_SEED = 0
+NORMALITY_CACHE_ENTRIES = 4096
+SIGNIFICANCE_ALPHA = 0.05
+BOOTSTRAP_RESAMPLES = 10_000
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_BATCH_CELLS = 500_000  # resamples x distinct pairs per batch; small batches stay in cache
+BOOTSTRAP_SEED = 0
+PERMUTATION_MAX = 10_000
+PERMUTATION_BLOCK = 500
+PERMUTATION_BLOCK_CELLS = 2_000_000   # permutations x rows shuffled at once
+PERMUTATION_MAX_CELLS = 20_000_000    # rows shuffled per test, bounding large continuous pairs
+PERMUTATION_STOP_LEVEL = 0.001   # chance that early stopping lands on the wrong side of alpha
+PERMUTATION_SEED = 0
+
+SCORING_METHODS = ["sum", "mean"]
+
+FREQUENCY_MAX_DOMAIN = 1024  # widest integer range counted with one bincount
+SCALE_SPECS_KEPT = 16        # scoring variants whose artifacts a ColumnArtifacts keeps
+
+# (lower bound of |rho|, texts key) from strongest to weakest
+CORRELATION_STRENGTHS = [
+    (0.7, "strong_corr"),
+    (0.5, "moderate_corr"),
+    (0.3, "weak_corr"),
+    (0.0, "no_corr"),
+]
+
+
+def column_values(df, col):
+    """Numeric values of one column as a float array without missing values"""
+    values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    return values[~np.isnan(values)]
+
+
+def paired_values(df, col_a, col_b):
+    """Float arrays for two columns, keeping only rows where both are present"""
+    a = pd.to_numeric(df[col_a], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    b = pd.to_numeric(df[col_b], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    keep = ~(np.isnan(a) | np.isnan(b))
+    return a[keep], b[keep]
+
+
+def _integer_codes(series):
+    """(codes, low, size) for an integer-valued column with a small range, else None
+
+    codes holds value - low, with missing values mapped to size.
+    """
+    if not pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        return None
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    observed = ~np.isnan(values)
+    present = values[observed]
+    if len(present) == 0:
+        return None
+    low, high = present.min(), present.max()
+    if high - low >= FREQUENCY_MAX_DOMAIN or not np.array_equal(present, np.floor(present)):
+        return None
+    size = int(high - low) + 1
+    codes = np.full(len(values), size, dtype=np.int64)
+    codes[observed] = (present - low).astype(np.int64)
+    return codes, low, size
+
+
+def frequency_tables(df, cols):
+    """value_counts(dropna=False) for many columns, each sorted by value with missing last
+
+    Integer-valued columns with a small range (Likert items, compact UInt8
+    codes) are counted together by a single np.bincount over their stacked
+    codes; any other column falls back to value_counts. Returns {col: Series}
+    with the counts named "count" and the index named after the column.
+    """
+    tables = {}
+    coded = []
+    for col in cols:
+        spec = _integer_codes(df[col])
+        if spec is None:
+            tables[col] = df[col].value_counts(dropna=False).sort_index(na_position='last')
+        else:
+            coded.append((col,) + spec)
+
+    if coded:
+        # One slot per value plus one for missing, per column, laid end to end
+        offsets = np.cumsum([0] + [size + 1 for _, _, _, size in coded])
+        counts = np.bincount(
+            np.concatenate([codes + offset for (_, codes, _, _), offset in zip(coded, offsets)]),
+            minlength=offsets[-1]
+        )
+        for (col, _, low, size), offset in zip(coded, offsets):
+            block = counts[offset:offset + size + 1]
+            keep = np.flatnonzero(block)
+            labels = np.append(low + np.arange(size, dtype=float), np.nan)[keep]
+            # Labels keep the column dtype (a missing slot only exists for NaN-capable dtypes)
+            index = pd.Index(labels, name=col).astype(df[col].dtype)
+            tables[col] = pd.Series(block[keep], index=index, name="count")
+    return {col: tables[col] for col in cols}
+
+
+def _numeric_frequencies(table):
+    """(values, counts) float arrays of a frequency table's numeric labels, by value"""
+    values = pd.to_numeric(pd.Series(table.index), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    keep = ~np.isnan(values)
+    values, weights = values[keep], table.to_numpy(dtype=float)[keep]
+    order = np.argsort(values, kind='stable')
+    return values[order], weights[order]
+
+
+def describe_frequencies(table):
+    """describe() of a numeric column computed from its frequency table"""
+    values, weights = _numeric_frequencies(table)
+    n = weights.sum()
+    stats = {"count": n, "mean": np.nan, "std": np.nan, "min": np.nan,
+             "25%": np.nan, "50%": np.nan, "75%": np.nan, "max": np.nan}
+    if n == 0:
+        return pd.Series(stats, name=table.index.name)
+    mean = (values * weights).sum() / n
+    stats.update({
+        "mean": mean,
+        "std": np.sqrt((weights * (values - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan,
+        "min": values[0],
+        "max": values[-1],
+    })
+    # Linear interpolation between order statistics, as Series.quantile does
+    cum = np.cumsum(weights)
+    for label, q in (("25%", 0.25), ("50%", 0.5), ("75%", 0.75)):
+        h = q * (n - 1)
+        lo, hi = np.searchsorted(cum, [np.floor(h), np.ceil(h)], side='right')
+        stats[label] = values[lo] + (h - np.floor(h)) * (values[hi] - values[lo])
+    return pd.Series(stats, name=table.index.name)
+
+
+def starts_with_letter(c, letter):
+    try:
+        return bool(re.match(rf"^\s*{letter}", str(c), flags=re.I))
+    except Exception:
+        return False
+
+
+def split_item_groups(cols):
+    """Split selected columns into (x_cols, y_cols, other_cols) by header prefix"""
+    x_cols = [c for c in cols if starts_with_letter(c, 'x')]
+    y_cols = [c for c in cols if starts_with_letter(c, 'y')]
+    other_cols = [c for c in cols if c not in x_cols + y_cols]
+    return x_cols, y_cols, other_cols
+
+
+def item_group_scales(cols):
+    """{"X_TOTAL": x items, "Y_TOTAL": y items} for the groups present in cols"""
+    x_cols, y_cols, _ = split_item_groups(cols)
+    return {name: items for name, items in (("X_TOTAL", x_cols), ("Y_TOTAL", y_cols)) if items}
+
+
+def parse_scale_mapping(text, columns):
+    """{name: items} from lines like "NAME = item1, item2"
+
+    Item names are matched against columns as text; unknown items raise
+    ValueError so a typo never silently shrinks a scale.
+    """
+    by_name = {str(c).strip(): c for c in columns}
+    scales = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        name, sep, items = line.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Expected NAME = item1, item2: {line.strip()}")
+        names = [item.strip() for item in items.split(",") if item.strip()]
+        unknown = [item for item in names if item not in by_name]
+        if unknown or not names:
+            raise ValueError(f"Unknown items for {name.strip()}: {', '.join(unknown) or '-'}")
+        scales[name.strip()] = [by_name[item] for item in names]
+    return scales
+
+
+def scale_spec(name, items, reverse=(), method="sum", min_answered=1, scale_range=None):
+    """Hashable description of one scale score:
+    (name, items, reverse, method, min_answered, scale_range)
+
+    reverse holds the scale's reverse-coded items, mirrored on the declared
+    (low, high) response scale_range, or on each item's observed range when
+    none is given. method is "sum" or "mean", and respondents who answered
+    fewer than min_answered items (capped at the scale size) get a missing
+    score.
+    """
+    if method not in SCORING_METHODS:
+        raise ValueError(f"Unknown scoring method: {method}")
+    if scale_range is not None:
+        low, high = map(float, scale_range)
+        if low >= high:
+            raise ValueError(f"Scale range must have low < high: {scale_range}")
+        scale_range = (low, high)
+    items = tuple(items)
+    reverse = tuple(c for c in items if c in set(reverse))
+    return (name, items, reverse, method, max(1, min(int(min_answered), len(items))), scale_range)
+
+
+def scale_specs(scales, reverse=(), method="sum", min_answered=1, scale_range=None):
+    """scale_spec for every {name: items} entry with shared scoring options"""
+    return [scale_spec(name, items, reverse, method, min_answered, scale_range) for name, items in scales.items()]
+
+
+def _mirror_sums(X, answered, scale_range=None):
+    """low + high of each item column; reverse coding maps v to this minus v
+
+    The declared (low, high) scale_range when given, else each item's
+    observed answers.
+    """
+    if scale_range is not None:
+        return np.full(X.shape[1], sum(scale_range))
+    low = np.where(answered, X, np.inf).min(axis=0, initial=np.inf)
+    high = np.where(answered, X, -np.inf).max(axis=0, initial=-np.inf)
+    with np.errstate(invalid='ignore'):
+        return low + high
+
+
+def _item_coding(spec, col):
+    """How col enters a scale: None (as answered), else the scale_range it is mirrored on"""
+    return None if col not in spec[2] else ("reverse", spec[5])
+
+
+def score_scales(df, specs):
+    """Scores of many scales as one DataFrame, a column per scale_spec
+
+    Reverse-coded items are mirrored as low + high - value (see
+    scale_spec). All sums and answered-item counts then come from one
+    matrix product of the zero-filled item matrix and its answered mask
+    with an item x scale weight matrix, so missing answers never count as 0.
+    """
+    # An item can be reverse-coded in one scale and not in another
+    keys = list(dict.fromkeys((c, _item_coding(spec, c)) for spec in specs for c in spec[1]))
+    columns = list(dict.fromkeys(c for c, _ in keys))
+    X = numeric_matrix(df, columns)
+    answered = ~np.isnan(X)
+    observed_sum = _mirror_sums(X, answered)
+
+    position = {c: i for i, c in enumerate(columns)}
+    take = [position[c] for c, _ in keys]
+    mirror = np.array([coding is not None for _, coding in keys], dtype=bool)
+    mirror_sum = np.array([
+        np.nan if coding is None else observed_sum[position[c]] if coding[1] is None else sum(coding[1])
+        for c, coding in keys
+    ])
+    values = np.where(answered, X, 0.0)[:, take]
+    mask = answered[:, take]
+    values[:, mirror] = np.where(mask[:, mirror], mirror_sum[mirror] - values[:, mirror], 0.0)
+
+    weights = np.zeros((len(keys), len(specs)))
+    index = {key: i for i, key in enumerate(keys)}
+    for k, spec in enumerate(specs):
+        weights[[index[c, _item_coding(spec, c)] for c in spec[1]], k] = 1.0
+    sums, counts = np.stack([values, mask.astype(float)]) @ weights
+
+    is_mean = np.array([spec[3] == "mean" for spec in specs])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = np.where(is_mean, sums / counts, sums)
+    scores[counts < np.array([spec[4] for spec in specs])] = np.nan
+    return pd.DataFrame(scores, index=df.index, columns=[spec[0] for spec in specs])
+
+
+def scale_reliability(df, items, reverse=(), scale_range=None):
+    """Cronbach's alpha of a scale with per-item diagnostics, from one covariance matrix
+
+    Uses respondents who answered every item, with reverse-coded items
+    mirrored as in score_scales. Returns {"alpha", "n", "k", "items"} where
+    items is a DataFrame of each item's mean, std, corrected item-total
+    correlation and alpha if the item is deleted.
+    """
+    items = list(items)
+    X = numeric_matrix(df, items)
+    answered = ~np.isnan(X)
+    mirror = np.array([c in set(reverse) for c in items], dtype=bool)
+    X[:, mirror] = _mirror_sums(X, answered, scale_range)[mirror] - X[:, mirror]
+    X = X[answered.all(axis=1)]
+    n, k = X.shape
+    alpha = np.nan
+    stats = pd.DataFrame(np.nan, index=pd.Index(items, name="item"),
+                         columns=["mean", "std", "item_total_r", "alpha_if_deleted"])
+    if n > 1:
+        C = np.atleast_2d(np.cov(X, rowvar=False))
+        item_var = np.diag(C)
+        total_var = C.sum()
+        # Dropping item i removes its row and column from the total variance
+        rest_var = total_var - 2 * C.sum(axis=1) + item_var
+        stats["mean"] = X.mean(axis=0)
+        stats["std"] = np.sqrt(item_var)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if k > 1:
+                alpha = k / (k - 1) * (1 - item_var.sum() / total_var)
+                stats["item_total_r"] = (C.sum(axis=1) - item_var) / np.sqrt(item_var * rest_var)
+            if k > 2:
+                stats["alpha_if_deleted"] = (k - 1) / (k - 2) * (1 - (item_var.sum() - item_var) / rest_var)
+    return {"alpha": float(alpha), "n": int(n), "k": int(k), "items": stats}
+
+
+def _normality_sample(values):
+    """values, or a seeded subsample of NORMALITY_MAX_SAMPLE of them"""
+    if len(values) <= NORMALITY_MAX_SAMPLE:
+        return values
+    rng = np.random.default_rng(NORMALITY_SEED)
+    return values[np.sort(rng.choice(len(values), NORMALITY_MAX_SAMPLE, replace=False))]
+
+
+def _normality_result(test, stat, p, n):
+    return {"test": test, "stat": None if stat is None else float(stat),
+            "p": None if p is None else float(p), "n": n}
+
+
+def normality_test(data):
+    """Normality test chosen by sample size; returns {test, stat, p, n}
+
+    Shapiro-Wilk up to SHAPIRO_MAX_N values, D'Agostino's K^2 above that
+    (on a seeded subsample beyond NORMALITY_MAX_SAMPLE). n is the number of
+    values actually tested; test is None when fewer than 3 are present.
+    """
+    values = np.asarray(data, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) < 3:
+        return _normality_result(None, None, None, len(values))
+    if len(values) > SHAPIRO_MAX_N:
+        values = _normality_sample(values)
+        stat, p_value = normaltest(values)
+        return _normality_result("D'Agostino K^2", stat, p_value, len(values))
+    try:
+        stat, p_value = shapiro(values)
+        return _normality_result("Shapiro-Wilk", stat, p_value, len(values))
+    except Exception:
+        try:
+            # Alternative: D'Agostino's K^2 test
+            stat, p_value = normaltest(values)
+            return _normality_result("D'Agostino K^2", stat, p_value, len(values))
+        except Exception:
+            return _normality_result(None, None, None, len(values))
+
+
+class NormalityCache(ByteLRUCache):
+    """LRU of normality_test results keyed by column content, bounded by entry count"""
+
+    def __init__(self, max_entries=NORMALITY_CACHE_ENTRIES):
+        super().__init__(max_entries)
+
+    def entry_size(self, entry):
+        return 1
+
+
+def normality_tests(df, cols, cache=None):
+    """normality_test for many columns in one call; returns {col: result}
+
+    Results are looked up in cache (a NormalityCache) by a fingerprint of the
+    column's values, so a column is only tested once whatever it is called.
+    """
+    results = {}
+    pending = {}
+    for col in cols:
+        values = column_values(df, col)
+        key = array_fingerprint(values)
+        hit = cache.get(key) if cache is not None else None
+        if hit is None:
+            pending[col] = (key, values)
+        else:
+            results[col] = hit
+
+    for col, (key, values) in pending.items():
+        results[col] = normality_test(values)
+        if cache is not None:
+            cache.put(key, results[col])
+    return {col: results[col] for col in cols}
+
+
+def choose_method(p1, p2, alpha=NORMALITY_ALPHA):
+    """Spearman if either variable is significantly non-normal, else Pearson"""
+    use_spearman = (p1 is not None and p1 <= alpha) or (p2 is not None and p2 <= alpha)
+    return "spearman" if use_spearman else "pearson"
+
+
+def correlate(x, y, method):
+    """Correlation coefficient and p-value for paired arrays"""
+    if method == "pearson":
+        corr, pval = pearsonr(x, y)
+    else:
+        corr, pval = spearmanr(x, y)
+    return float(corr), float(pval)
+
+
+def pair_table(x, y):
+    """Distinct (x, y) pairs and how often each occurs: (ux, uy, counts)
+
+    Likert pairs collapse to a few dozen rows, so resampling works on the
+    table instead of on every respondent.
+    """
+    pairs, counts = np.unique(np.column_stack([x, y]), axis=0, return_counts=True)
+    return pairs[:, 0], pairs[:, 1], counts
+
+
+def _tie_groups(values):
+    """(starts, group) of runs of equal values in a sorted array, or None without ties"""
+    levels, starts, group = np.unique(values, return_index=True, return_inverse=True)
+    return None if len(levels) == len(values) else (starts, group)
+
+
+def _sorted_ranks(weights, ties):
+    """Average (tie-aware) ranks under per-row weights for sorted values
+
+    weights: (B, m) counts per resample of ascending table values whose
+    _tie_groups are ties. Returns (B, m) ranks of each table row.
+    """
+    if ties is not None:
+        weights = np.add.reduceat(weights, ties[0], axis=1)
+    ranks = np.cumsum(weights, axis=1) - (weights - 1) / 2
+    return ranks if ties is None else ranks[:, ties[1]]
+
+
+def _rank_plan(ux, uy):
+    """Per-table ranking work shared by every Spearman batch
+
+    The pair table is sorted by x, so x ranks need no reordering; y is
+    ranked in by_y order, and y_position maps table rows to that order.
+    """
+    by_y = np.argsort(uy, kind='stable')
+    y_position = np.empty_like(by_y)
+    y_position[by_y] = np.arange(len(by_y))
+    return by_y, y_position, _tie_groups(ux), _tie_groups(uy[by_y])
+
+
+def _row_counts(rows, m):
+    """(B, m) float counts of the table rows drawn in each resample, via one bincount"""
+    size = len(rows)
+    offsets = np.arange(0, size * m, m)[:, None]
+    return np.bincount((rows + offsets).ravel(), minlength=size * m).reshape(size, m).astype(float)
+
+
+def _weighted_corr(a, b, weights):
+    """Row-wise Pearson r of ranks a, b (B, m) under (B, m) weights"""
+    n = weights.sum(axis=1)
+    wa, wb = weights * a, weights * b
+    sa, sb = wa.sum(axis=1), wb.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return ((wa * b).sum(axis=1) - sa * sb / n) / np.sqrt(
+            ((wa * a).sum(axis=1) - sa * sa / n) * ((wb * b).sum(axis=1) - sb * sb / n))
+
+
+def _weighted_pearson(a, b, weights):
+    """Row-wise Pearson r of fixed (m,) columns under (B, m) weights
+
+    All weighted sums come from a single (B, m) x (m, 5) matrix product.
+    """
+    a, b = a - a.mean(), b - b.mean()
+    n = weights.sum(axis=1)
+    sa, sb, saa, sbb, sab = (weights @ np.column_stack([a, b, a * a, b * b, a * b])).T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sab - sa * sb / n) / np.sqrt((saa - sa * sa / n) * (sbb - sb * sb / n))
+
+
+def _gathered_pearson(a, b, rows):
+    """Row-wise Pearson r of a[rows], b[rows] for a (B, n) matrix of drawn indices"""
+    a, b = a - a.mean(), b - b.mean()
+    xs, ys = a[rows], b[rows]
+    n = rows.shape[1]
+    sa, sb = xs.sum(axis=1), ys.sum(axis=1)
+    saa, sbb, sab = (np.einsum('ij,ij->i', xs, xs), np.einsum('ij,ij->i', ys, ys),
+                     np.einsum('ij,ij->i', xs, ys))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sab - sa * sb / n) / np.sqrt((saa - sa * sa / n) * (sbb - sb * sb / n))
+
+
+def _bootstrap_batch(ux, uy, counts, method, size, seed, plan=None):
+    """Correlation of `size` bootstrap resamples of a pair table
+
+    Tables much smaller than the sample draw multinomial count vectors.
+    Otherwise row indices are drawn: Pearson sums the gathered values
+    directly, Spearman counts them per table row to re-rank. plan is
+    _rank_plan(ux, uy) for Spearman.
+    """
+    rng = np.random.default_rng(seed)
+    n, m = int(counts.sum()), len(counts)
+    if method == "spearman":
+        by_y, y_position, x_ties, y_ties = plan if plan is not None else _rank_plan(ux, uy)
+    if m * 4 < n:
+        weights = rng.multinomial(n, counts / n, size=size).astype(float)
+        if method != "spearman":
+            return _weighted_pearson(ux, uy, weights)
+        weights_y = np.take(weights, by_y, axis=1)
+    else:
+        rows = rng.integers(0, n, size=(size, n))
+        if m < n:
+            rows = np.repeat(np.arange(m), counts)[rows]
+        if method != "spearman":
+            return _gathered_pearson(ux, uy, rows)
+        weights, weights_y = _row_counts(rows, m), _row_counts(y_position[rows], m)
+    ranks_x = np.take(_sorted_ranks(weights, x_ties), by_y, axis=1)
+    return _weighted_corr(ranks_x, _sorted_ranks(weights_y, y_ties), weights_y)
+
+
+def bootstrap_ci(x, y, method="pearson", n_resamples=BOOTSTRAP_RESAMPLES, confidence=BOOTSTRAP_CONFIDENCE,
+                 seed=BOOTSTRAP_SEED, pool=None):
+    """Percentile bootstrap confidence interval (low, high) for a correlation
+
+    Resamples are drawn over the distinct (x, y) pairs and the coefficient
+    of every resample in a batch comes from a few array reductions
+    (Spearman re-ranks with ties per resample). Each batch has its own
+    child seed, so the interval is the same whether the batches run here
+    or on pool (a concurrent.futures executor).
+
+    Cost grows with the number of distinct pairs: 10,000 resamples of 50k
+    Likert rows take about 0.1 s, but when every row is distinct
+    (continuous values) they take about 10 s (Pearson) or 40 s (Spearman)
+    per core, so spread those over a pool.
+    """
+    ux, uy, counts = pair_table(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    plan = _rank_plan(ux, uy) if method == "spearman" else None
+    batch = max(1, min(n_resamples, BOOTSTRAP_BATCH_CELLS // max(len(counts), 1)))
+    sizes = [min(batch, n_resamples - start) for start in range(0, n_resamples, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if pool is not None and len(sizes) > 1:
+        futures = [pool.submit(_bootstrap_batch, ux, uy, counts, method, size, ss, plan)
+                   for size, ss in zip(sizes, seeds)]
+        r = np.concatenate([f.result() for f in futures])
+    else:
+        r = np.concatenate([_bootstrap_batch(ux, uy, counts, method, size, ss, plan)
+                            for size, ss in zip(sizes, seeds)])
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.nanpercentile(r, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def _level_scores(levels, counts, method):
+    """Centered score of each distinct value: its mid-rank (Spearman) or the value itself"""
+    scores = np.cumsum(counts) - (counts - 1) / 2 if method == "spearman" else levels
+    return scores - (scores * counts).sum() / counts.sum()
+
+
+def _table_permutation_stats(a, row_counts, b, col_counts, size, rng):
+    """sum(n_ij * a_i * b_j) for `size` random contingency tables with fixed margins
+
+    Permuting y against x only reshuffles which y levels land in each x
+    level, so tables are drawn cell by cell from hypergeometric counts. The
+    cost depends on the number of levels, not on the number of respondents.
+    """
+    remaining = np.tile(col_counts, (size, 1))
+    stats = np.zeros(size)
+    for a_i, r_i in zip(a[:-1], row_counts[:-1]):
+        left = np.full(size, r_i)
+        pool = remaining.sum(axis=1)
+        for j in range(len(b) - 1):
+            pool -= remaining[:, j]
+            drawn = rng.hypergeometric(remaining[:, j], pool, left)
+            remaining[:, j] -= drawn
+            left -= drawn
+            stats += a_i * b[j] * drawn
+        remaining[:, -1] -= left
+        stats += a_i * b[-1] * left
+    return stats + a[-1] * (remaining @ b)
+
+
+def permutation_test(x, y, method="spearman", max_permutations=PERMUTATION_MAX, alpha=SIGNIFICANCE_ALPHA,
+                     seed=PERMUTATION_SEED):
+    """Two-sided permutation p-value for a correlation: (p, permutations run)
+
+    Values are ranked once; each block of permutations is scored with array
+    operations (random contingency tables for tied data such as Likert
+    items, shuffled score rows otherwise). Sampling stops as soon as a
+    Clopper-Pearson bound puts the p-value clearly above or below alpha.
+    Shuffling rows costs time per respondent, so that path also stops after
+    PERMUTATION_MAX_CELLS shuffled values (at least 100 permutations).
+    """
+    x_levels, x_codes, x_counts = np.unique(np.asarray(x, dtype=float), return_inverse=True, return_counts=True)
+    y_levels, y_codes, y_counts = np.unique(np.asarray(y, dtype=float), return_inverse=True, return_counts=True)
+    a = _level_scores(x_levels, x_counts, method)
+    b = _level_scores(y_levels, y_counts, method)
+    a_rows, b_rows = a[x_codes], b[y_codes]
+    observed = abs(a_rows @ b_rows) * (1 - 1e-12)
+    n = len(a_rows)
+    use_tables = len(a) * len(b) * 32 < n
+    block = PERMUTATION_BLOCK
+    if not use_tables:
+        block = max(1, min(block, PERMUTATION_BLOCK_CELLS // n))
+        max_permutations = min(max_permutations, max(100, PERMUTATION_MAX_CELLS // n))
+    rng = np.random.default_rng(seed)
+    hits = done = 0
+    while done < max_permutations:
+        size = min(block, max_permutations - done)
+        if use_tables:
+            stats = _table_permutation_stats(a, x_counts, b, y_counts, size, rng)
+        else:
+            shuffled = np.tile(b_rows, (size, 1))
+            rng.permuted(shuffled, axis=1, out=shuffled)
+            stats = shuffled @ a_rows
+        hits += int((np.abs(stats) >= observed).sum())
+        done += size
+        low = beta.ppf(PERMUTATION_STOP_LEVEL / 2, hits, done - hits + 1) if hits else 0.0
+        high = beta.ppf(1 - PERMUTATION_STOP_LEVEL / 2, hits + 1, done - hits) if hits < done else 1.0
+        if high < alpha or low > alpha:
+            break
+    return (hits + 1) / (done + 1), done
+
+
+def numeric_matrix(df, cols):
+    """Columns as one float64 (rows x columns) array with NaN for missing values"""
+    return np.column_stack([
+        pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=float, na_value=np.nan) for c in cols
+    ]) if len(cols) else np.empty((len(df), 0))
+
+
+def correlation_arrays(X, method="pearson"):
+    """All-pairs correlation of the columns of X with pairwise-complete rows
+
+    Returns (r, p, n) as k x k arrays. Every pairwise sum comes from a handful
+    of matrix products over the value and missing-value masks, so no Python
+    loop runs over pairs. Spearman ranks each column once over its own
+    observed values (exact when nothing is missing). p-values use the same
+    two-sided t-distribution test as scipy's pearsonr/spearmanr.
+    """
+    X = np.asarray(X, dtype=float)
+    if method == "spearman":
+        X = rankdata(X, axis=0, nan_policy='omit')
+    observed = ~np.isnan(X)
+    M = observed.astype(float)
+    # Centre on column means first to keep the sums well conditioned
+    with np.errstate(invalid='ignore'):
+        X0 = np.where(observed, X - np.nanmean(X, axis=0), 0.0)
+
+    n = M.T @ M
+    sx = X0.T @ M             # sx[i, j]: sum of column i over rows where j is present
+    sxx = (X0 * X0).T @ M
+    sxy = X0.T @ X0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        r = cov / np.sqrt(var_i * var_i.T)
+        r = np.clip(r, -1.0, 1.0)
+        df_t = n - 2
+        t_stat = r * np.sqrt(df_t / np.maximum(1.0 - r * r, 1e-300))
+        p = 2 * t_dist.sf(np.abs(t_stat), df_t)
+    p[df_t <= 0] = np.nan
+    np.fill_diagonal(r, np.where(np.diag(n) >= 2, 1.0, np.nan))
+    np.fill_diagonal(p, 0.0)
+    return r, p, n.astype(np.int64)
+
+
+def correlation_matrix(df, cols, method="pearson"):
+    """correlation_arrays for DataFrame columns; returns (r, p, n) DataFrames"""
+    r, p, n = correlation_arrays(numeric_matrix(df, cols), method)
+    labels = list(cols)
+    return (
+        pd.DataFrame(r, index=labels, columns=labels),
+        pd.DataFrame(p, index=labels, columns=labels),
+        pd.DataFrame(n, index=labels, columns=labels),
+    )
+
+
+def cluster_order(r):
+    """Column order that places strongly correlated columns next to each other
+
+    Average-linkage hierarchical clustering on the distance 1 - |r|; columns
+    with undefined correlations (constant columns) are treated as unrelated.
+    """
+    R = np.nan_to_num(np.asarray(r, dtype=float), nan=0.0)
+    k = len(R)
+    if k < 3:
+        return np.arange(k)
+    dist = 1.0 - np.abs(R)
+    dist = (dist + dist.T) / 2
+    np.fill_diagonal(dist, 0.0)
+    return leaves_list(linkage(squareform(np.clip(dist, 0.0, None), checks=False), method='average'))
+
+
+def correlation_strength_key(rho):
+    """texts key describing the strength of a correlation coefficient"""
+    abs_rho = abs(rho)
+    for bound, key in CORRELATION_STRENGTHS:
+        if abs_rho >= bound:
+            return key
+    return "no_corr"
+
+
+def correlation_direction_key(rho):
+    """texts key for the sign of a correlation coefficient"""
+    if rho > 0:
+        return "pos_corr"
+    if rho < 0:
+        return "neg_corr"
+    return "no_dir_corr"
+
+
+def format_p_value(p):
+    """Format p-value nicely"""
+    if p < 0.0001:
+        return "0.0000"
+    else:
+        return f"{p:.4f}"
+
+
+def auto_association(df, var1, var2, normality_cache=None):
+    """Normality-driven correlation of two columns, as in the st17 auto analysis
+
+    Returns a dict with the normality p-values, the chosen method and, when
+    at least two paired rows remain, the coefficient, p-value and sample size.
+    """
+    normality = normality_tests(df, [var1, var2], normality_cache)
+    p1, p2 = normality[var1]["p"], normality[var2]["p"]
+    method = choose_method(p1, p2)
+    result = {"var1": var1, "var2": var2, "p_normal1": p1, "p_normal2": p2,
+              "method": method, "n": 0, "rho": None, "p_value": None}
+
+    x, y = paired_values(df, var1, var2)
+    result["n"] = len(x)
+    if len(x) >= 2:
+        result["rho"], result["p_value"] = correlate(x, y, method)
+        result["strength"] = correlation_strength_key(result["rho"])
+        result["significant"] = result["p_value"] < SIGNIFICANCE_ALPHA
+    return result
+
+
+def _summary_dict(series):
+    """describe() of one series as a dict with NaN mapped to None"""
+    stats = series.describe()
+    return {k: (None if pd.isna(v) else float(v)) for k, v in stats.items()}
+
+
+def analyze_dataset(df, numeric_cols, pairs=None, scales=None, reverse=(), method="sum", min_answered=1,
+                    scale_range=None):
+    """Full app pipeline on one coerced frame, as plain JSON-ready data
+
+    Covers descriptive statistics, scale scores and reliability (X_TOTAL/
+    Y_TOTAL unless a {name: items} scales mapping is given; items missing
+    from this file are left out and listed under the scale's "missing"),
+    per-column normality and the st17 auto
+    association for X_TOTAL vs Y_TOTAL plus any extra pairs.
+    """
+    df = df.copy(deep=False)
+    x_cols, y_cols, other_cols = split_item_groups(numeric_cols)
+    result = {
+        "rows": len(df),
+        "numeric_columns": list(numeric_cols),
+        "x_items": x_cols,
+        "y_items": y_cols,
+        "other_columns": other_cols,
+        "descriptive": {str(c): _summary_dict(df[c].astype('float64')) for c in numeric_cols},
+        "totals": {},
+        "scales": {},
+        "reliability": {},
+        "normality": {},
+        "associations": [],
+    }
+    if scales is None:
+        scales = item_group_scales(numeric_cols)
+    present = set(numeric_cols)
+    missing = {name: [c for c in items if c not in present] for name, items in scales.items()}
+    scales = {name: [c for c in items if c in present] for name, items in scales.items()}
+    specs = scale_specs({name: items for name, items in scales.items() if items}, reverse, method, min_answered,
+                        scale_range)
+    scores = score_scales(df, specs)
+    for name, items, reversed_items, scoring, minimum, declared_range in specs:
+        df[name] = scores[name]
+        result["totals"][name] = _summary_dict(df[name])
+        result["scales"][name] = {"items": list(items), "reverse": list(reversed_items), "method": scoring,
+                                  "min_answered": minimum,
+                                  "scale_range": list(declared_range) if declared_range else None,
+                                  "missing": missing[name]}
+        reliability = scale_reliability(df, items, reversed_items, declared_range)
+        result["reliability"][name] = {
+            "alpha": reliability["alpha"],
+            "n": reliability["n"],
+            "items": {str(item): row for item, row in reliability["items"].to_dict(orient="index").items()},
+        }
+
+    normality_cache = NormalityCache()
+    tested = normality_tests(df, list(numeric_cols) + list(result["totals"]), normality_cache)
+    for col, test in tested.items():
+        result["normality"][str(col)] = test["p"]
+
+    pairs = list(pairs or [])
+    if "X_TOTAL" in df.columns and "Y_TOTAL" in df.columns:
+        pairs.insert(0, ("X_TOTAL", "Y_TOTAL"))
+    for var1, var2 in pairs:
+        if var1 in df.columns and var2 in df.columns:
+            assoc = auto_association(df, var1, var2, normality_cache)
+            assoc["var1"], assoc["var2"] = str(var1), str(var2)
+            result["associations"].append(assoc)
+    return result
+
+
+def histogram_bins(n):
+    """Bin count of the item histograms: sqrt(n) clamped to 5..20"""
+    return min(20, max(5, int(np.sqrt(n))))
+
+
+def frequency_histogram(table):
+    """(counts, edges) of a column's histogram from its frequency table, or None
+
+    Same bins and counts as np.histogram over the raw values, but the cost
+    depends on the number of distinct values rather than on the row count.
+    """
+    values, weights = _numeric_frequencies(table)
+    if len(values) == 0:
+        return None
+    return np.histogram(values, bins=histogram_bins(int(weights.sum())), weights=weights)
+
+
+class ColumnArtifacts:
+    """Per-column analysis results of one dataset, each built once on demand
+
+    Artifacts depend on each other column by column:
+
+        column -> frequency table -> descriptive stats, histogram
+        column -> fingerprint (chart cache keys)
+        scale_spec -> reliability
+
+    and a scale score, passed as a scale_spec, is a derived column that
+    depends only on its items and scoring options. Everything is memoized per artifact
+    and column, so a selection change computes just the columns that were
+    never requested; their tables are still counted in one pass. Artifacts
+    of the least recently used scale_specs beyond max_specs are evicted, so
+    trying scoring options does not grow the cache for the life of the
+    dataset. Shared between reruns and sessions, so returned values must not
+    be modified.
+    """
+
+    def __init__(self, df, max_specs=SCALE_SPECS_KEPT):
+        self.df = df
+        self.max_specs = max_specs
+        self._artifacts = {}
+        self._specs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def label(col):
+        """Display name of a column or scale_spec"""
+        return col[0] if isinstance(col, tuple) else col
+
+    def _touch(self, cols):
+        """Mark scale_specs as recently used and evict the oldest; caller holds the lock"""
+        for col in cols:
+            if isinstance(col, tuple):
+                self._specs[col] = None
+                self._specs.move_to_end(col)
+        while len(self._specs) > self.max_specs:
+            spec, _ = self._specs.popitem(last=False)
+            for key in [key for key in self._artifacts if key[1] == spec]:
+                del self._artifacts[key]
+
+    def _lookup(self, kind, cols):
+        with self._lock:
+            found = {col: self._artifacts[kind, col] for col in cols if (kind, col) in self._artifacts}
+            self._touch(found)
+        return found, [col for col in dict.fromkeys(cols) if col not in found]
+
+    def _store(self, kind, built):
+        with self._lock:
+            stored = {col: self._artifacts.setdefault((kind, col), value) for col, value in built.items()}
+            self._touch(stored)
+            return stored
+
+    def _each(self, kind, cols, build):
+        found, missing = self._lookup(kind, cols)
+        found.update(self._store(kind, {col: build(col) for col in missing}))
+        return {self.label(col): found[col] for col in cols}
+
+    def scores(self, specs):
+        """{label: score Series}, scoring all scales not seen before in one pass"""
+        found, missing = self._lookup("series", specs)
+        if missing:
+            scored = score_scales(self.df, missing)
+            found.update(self._store("series", {spec: scored.iloc[:, i] for i, spec in enumerate(missing)}))
+        return {self.label(spec): found[spec] for spec in specs}
+
+    def frame(self, cols):
+        """DataFrame of columns and scale scores, labelled by display name"""
+        scores = self.scores([col for col in cols if isinstance(col, tuple)])
+        return pd.DataFrame({self.label(col): scores[col[0]] if isinstance(col, tuple) else self.df[col]
+                             for col in cols}, index=self.df.index)
+
+    def tables(self, cols):
+        """{label: frequency table}, counting all missing columns in one pass"""
+        found, missing = self._lookup("table", cols)
+        if missing:
+            counted = frequency_tables(self.frame(missing), [self.label(col) for col in missing])
+            found.update(self._store("table", {col: counted[self.label(col)] for col in missing}))
+        return {self.label(col): found[col] for col in cols}
+
+    def histograms(self, cols):
+        """{label: (counts, edges) or None} built from the frequency tables"""
+        tables = self.tables(cols)
+        return self._each("hist", cols, lambda col: frequency_histogram(tables[self.label(col)]))
+
+    def describe(self, cols):
+        """describe() table of the columns, one cached statistics column each"""
+        tables = self.tables(cols)
+        return pd.DataFrame(self._each("stats", cols, lambda col: describe_frequencies(tables[self.label(col)])))
+
+    def reliability(self, specs):
+        """{label: scale_reliability result} for scale_specs, one covariance pass per scale"""
+        return self._each("reliability", specs, lambda spec: scale_reliability(self.df, *spec[1:3], spec[5]))
+
+    def fingerprints(self, cols):
+        """{label: content hash} for chart cache keys, hashed once per column"""
+        return self._each("fingerprint", cols, lambda col: frame_fingerprint(self.frame([col])))
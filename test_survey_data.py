@@ -0,0 +1,91 @@
+"""Checks of survey loading against pandas
+
+Run with: python -m pytest test_survey_data.py
+"""
+import datetime
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import survey_data
+from survey_data import DatasetCache, load_dataset, load_sidecar, stream_excel
+
+
+def survey_csv(rows=200, seed=0):
+    """CSV bytes with Likert items, a float, free text, a category and numbers mixed with "n/a" """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "X1": rng.integers(1, 6, rows).astype(float),
+        "X2": rng.integers(1, 6, rows).astype(float),
+        "Income": rng.normal(5000, 1500, rows).round(2),
+        "Name": [f"resp{i}" for i in range(rows)],
+        "Gender": rng.choice(["F", "M"], rows),
+        "Mixed": [str(v) for v in rng.integers(1, 6, rows)],
+    })
+    df.loc[::9, "X2"] = np.nan
+    df.loc[::7, "Mixed"] = "n/a"
+    return df.to_csv(index=False).encode()
+
+
+def test_sidecar_round_trip_matches_parsed_dataset(tmp_path):
+    parsed = load_dataset(survey_csv(), DatasetCache(max_bytes=0), name="survey.csv", sidecar_dir=str(tmp_path))
+    loaded = load_sidecar(parsed.key, str(tmp_path))
+
+    assert loaded is not None
+    pd.testing.assert_frame_equal(loaded.df, parsed.df)
+    pd.testing.assert_frame_equal(loaded.raw, parsed.raw)
+    assert loaded.name == parsed.name
+    assert loaded.maybe_numeric == parsed.maybe_numeric
+    assert loaded.column_types == parsed.column_types
+    assert loaded.memory_report == parsed.memory_report
+
+
+def test_load_dataset_reads_back_its_sidecar(tmp_path, monkeypatch):
+    data = survey_csv()
+    parsed = load_dataset(data, DatasetCache(max_bytes=0), name="survey.csv", sidecar_dir=str(tmp_path))
+
+    def no_parsing(*args, **kwargs):
+        pytest.fail("the upload was parsed again instead of read from its sidecar")
+
+    monkeypatch.setattr(survey_data, "read_table", no_parsing)
+    again = load_dataset(data, DatasetCache(max_bytes=0), name="survey.csv", sidecar_dir=str(tmp_path))
+
+    pd.testing.assert_frame_equal(again.df, parsed.df)
+    assert load_sidecar("missing-key", str(tmp_path)) is None
+
+
+def survey_xlsx(rows=2500, seed=0):
+    """XLSX bytes with repeated and empty headers, blank rows, NA markers and numbers stored as text"""
+    rng = np.random.default_rng(seed)
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Q1", "Q1", None, "Name", "Score", "Mixed", "When"])
+    for i in range(rows):
+        if i == rows // 2:
+            ws.append([None] * 7)
+            continue
+        ws.append([
+            int(rng.integers(1, 6)) if i % 17 else None,
+            float(rng.normal()),
+            i if i % 3 else None,
+            f"resp{i}" if i % 11 else "NA",
+            str(int(rng.integers(1, 100))) if i % 5 else None,
+            "n/a" if i % 7 == 0 else int(rng.integers(1, 6)),
+            datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i),
+        ])
+    ws.append([None] * 7)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("block_cells", [survey_data.STREAM_BLOCK_CELLS, 1])
+def test_stream_excel_matches_read_excel(block_cells):
+    data = survey_xlsx()
+    # block_cells=1 converts the sheet in several blocks of 1000 rows
+    streamed = stream_excel(data, block_cells=block_cells)
+
+    pd.testing.assert_frame_equal(streamed, pd.read_excel(io.BytesIO(data)))
@@ -0,0 +1,252 @@
+"""Checks of the survey_engine statistics against scipy and pandas
+
+Run with: python -m pytest test_survey_engine.py
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import normaltest, pearsonr, rankdata, shapiro, spearmanr
+
+from survey_engine import (
+    NORMALITY_MAX_SAMPLE, PERMUTATION_MAX, PERMUTATION_MAX_CELLS, SHAPIRO_MAX_N, NormalityCache,
+    _bootstrap_batch, bootstrap_ci, correlation_arrays, describe_frequencies, frequency_tables, normality_test,
+    normality_tests, pair_table, permutation_test, scale_reliability, scale_specs, score_scales,
+)
+
+
+def likert_frame(rows=300, items=5, missing=0.1, seed=0):
+    """Correlated 1-5 answers for X1..Xk with some unanswered items"""
+    rng = np.random.default_rng(seed)
+    trait = rng.normal(size=(rows, 1))
+    values = np.clip(np.rint(3 + trait + rng.normal(size=(rows, items))), 1, 5)
+    values[rng.random(values.shape) < missing] = np.nan
+    return pd.DataFrame(values, columns=[f"X{i + 1}" for i in range(items)])
+
+
+def correlated_pairs(n, kind, seed=0, weight=0.5):
+    """x, y sharing a trait (r about 0.3 by default): Likert 1-5, rounded to one decimal, or continuous"""
+    rng = np.random.default_rng(seed)
+    trait = rng.normal(size=n)
+    x, y = trait + rng.normal(size=n), weight * trait + rng.normal(size=n)
+    if kind == "likert":
+        return np.clip(np.rint(3 + x), 1, 5), np.clip(np.rint(3 + y), 1, 5)
+    if kind == "rounded":
+        return x.round(1), y.round(1)
+    return x, y
+
+
+def reference_alpha(X):
+    """Cronbach's alpha from the textbook formula"""
+    k = X.shape[1]
+    return k / (k - 1) * (1 - X.var(axis=0, ddof=1).sum() / X.sum(axis=1).var(ddof=1))
+
+
+def test_correlation_arrays_pearson_matches_pandas_and_scipy():
+    df = likert_frame()
+    df["Age"] = np.random.default_rng(1).normal(40, 10, len(df))
+    r, p, n = correlation_arrays(df.to_numpy(), "pearson")
+
+    np.testing.assert_allclose(r, df.corr(method="pearson").to_numpy(), atol=1e-12)
+    for i in range(df.shape[1]):
+        for j in range(i + 1, df.shape[1]):
+            pair = df.iloc[:, [i, j]].dropna()
+            assert n[i, j] == len(pair)
+            assert p[i, j] == pytest.approx(pearsonr(pair.iloc[:, 0], pair.iloc[:, 1])[1], rel=1e-8)
+
+
+def test_correlation_arrays_spearman_matches_scipy_without_missing():
+    df = likert_frame(missing=0)
+    r, p, _ = correlation_arrays(df.to_numpy(), "spearman")
+    expected = spearmanr(df.to_numpy())
+
+    np.testing.assert_allclose(r, expected.statistic, atol=1e-12)
+    off_diagonal = ~np.eye(df.shape[1], dtype=bool)
+    np.testing.assert_allclose(p[off_diagonal], expected.pvalue[off_diagonal], rtol=1e-8)
+
+
+@pytest.mark.parametrize("column", ["X1", "score"])
+def test_describe_frequencies_matches_describe(column):
+    df = likert_frame()
+    # A continuous column goes through value_counts instead of the bincount path
+    df["score"] = np.random.default_rng(2).normal(size=len(df)).round(3)
+    df.loc[::7, "score"] = np.nan
+    table = frequency_tables(df, [column])[column]
+
+    pd.testing.assert_series_equal(describe_frequencies(table), df[column].describe(), check_names=False)
+
+
+@pytest.mark.parametrize("method", ["sum", "mean"])
+def test_score_scales_matches_pandas(method):
+    df = likert_frame()
+    specs = scale_specs({"A": ["X1", "X2", "X3"], "B": ["X2", "X4", "X5"]}, ["X2"], method, 2, (1, 5))
+    scores = score_scales(df, specs)
+
+    coded = df.copy()
+    coded["X2"] = 6 - coded["X2"]
+    for name, items in (("A", ["X1", "X2", "X3"]), ("B", ["X2", "X4", "X5"])):
+        expected = coded[items].mean(axis=1) if method == "mean" else coded[items].sum(axis=1)
+        expected[coded[items].notna().sum(axis=1) < 2] = np.nan
+        pd.testing.assert_series_equal(scores[name], expected, check_names=False)
+
+
+def test_score_scales_mirrors_on_observed_range_without_declared_range():
+    df = pd.DataFrame({"X1": [2.0, 3.0, 5.0], "X2": [5.0, 4.0, 2.0]})
+    declared = score_scales(df, scale_specs({"X": ["X1", "X2"]}, ["X2"], "sum", 1, (1, 5)))["X"]
+    observed = score_scales(df, scale_specs({"X": ["X1", "X2"]}, ["X2"], "sum", 1))["X"]
+
+    assert declared.tolist() == [3.0, 5.0, 9.0]  # 5 -> 1 on a 1-5 scale
+    assert observed.tolist() == [4.0, 6.0, 10.0]  # 5 -> 2 on the answered 2-5 range
+
+
+def test_scale_reliability_matches_textbook_formulas():
+    df = likert_frame(items=4)
+    result = scale_reliability(df, ["X1", "X2", "X3", "X4"], reverse=["X3"], scale_range=(1, 5))
+
+    coded = df.copy()
+    coded["X3"] = 6 - coded["X3"]
+    complete = coded.dropna()
+    assert result["n"] == len(complete)
+    assert result["k"] == 4
+    assert result["alpha"] == pytest.approx(reference_alpha(complete))
+
+    items = result["items"]
+    for item in complete.columns:
+        rest = complete.drop(columns=item)
+        assert items.loc[item, "mean"] == pytest.approx(complete[item].mean())
+        assert items.loc[item, "std"] == pytest.approx(complete[item].std())
+        assert items.loc[item, "item_total_r"] == pytest.approx(complete[item].corr(rest.sum(axis=1)))
+        assert items.loc[item, "alpha_if_deleted"] == pytest.approx(reference_alpha(rest))
+
+
+@pytest.mark.parametrize("n, test, reference", [
+    (50, "Shapiro-Wilk", shapiro),
+    (SHAPIRO_MAX_N, "Shapiro-Wilk", shapiro),
+    (SHAPIRO_MAX_N + 1, "D'Agostino K^2", normaltest),
+])
+def test_normality_test_switches_by_sample_size(n, test, reference):
+    values = np.random.default_rng(3).gamma(4.0, size=n)
+    result = normality_test(np.append(values, np.nan))
+    stat, p = reference(values)
+
+    assert result["test"] == test
+    assert result["n"] == n
+    assert result["stat"] == pytest.approx(stat)
+    assert result["p"] == pytest.approx(p)
+
+
+def test_normality_test_subsamples_large_columns():
+    skewed = np.random.default_rng(4).exponential(size=NORMALITY_MAX_SAMPLE + 5000)
+    result = normality_test(skewed)
+
+    assert result["test"] == "D'Agostino K^2"
+    assert result["n"] == NORMALITY_MAX_SAMPLE
+    assert result["p"] < 1e-6
+    assert normality_test(skewed) == result  # the subsample is seeded
+
+
+def test_normality_test_needs_three_values():
+    assert normality_test([1.0, np.nan, 2.0]) == {"test": None, "stat": None, "p": None, "n": 2}
+
+
+def test_normality_tests_reuses_cached_results():
+    df = likert_frame()
+    cache = NormalityCache()
+    first = normality_tests(df, ["X1", "X2"], cache)
+    # Same values under another name are found by content
+    again = normality_tests(df.rename(columns={"X1": "copy"}), ["copy"], cache)
+
+    assert first["X1"] == normality_test(df["X1"].dropna())
+    assert again["copy"] is first["X1"]
+
+
+def reference_resample_counts(counts, size, seed):
+    """How often each pair_table row is drawn per resample, from the same random stream as _bootstrap_batch"""
+    rng = np.random.default_rng(seed)
+    n, m = int(counts.sum()), len(counts)
+    if m * 4 < n:
+        return rng.multinomial(n, counts / n, size=size)
+    rows = rng.integers(0, n, size=(size, n))
+    if m < n:
+        rows = np.repeat(np.arange(m), counts)[rows]
+    return np.array([np.bincount(drawn, minlength=m) for drawn in rows])
+
+
+# Likert pairs draw multinomial tables; rounded and continuous pairs draw rows
+@pytest.mark.parametrize("kind, n", [("likert", 400), ("rounded", 300), ("continuous", 300)])
+@pytest.mark.parametrize("method, reference", [("pearson", pearsonr), ("spearman", spearmanr)])
+def test_bootstrap_batch_matches_scipy_on_each_resample(kind, n, method, reference):
+    ux, uy, counts = pair_table(*correlated_pairs(n, kind))
+    seed = np.random.SeedSequence(3)
+    got = _bootstrap_batch(ux, uy, counts, method, 8, seed)
+
+    expected = [reference(np.repeat(ux, w), np.repeat(uy, w))[0]
+                for w in reference_resample_counts(counts, 8, seed)]
+    np.testing.assert_allclose(got, expected, atol=1e-10)
+
+
+@pytest.mark.parametrize("method, reference", [("pearson", pearsonr), ("spearman", spearmanr)])
+def test_bootstrap_ci_matches_a_naive_percentile_bootstrap(method, reference):
+    x, y = correlated_pairs(300, "rounded")
+    low, high = bootstrap_ci(x, y, method, n_resamples=2000)
+
+    rng = np.random.default_rng(1)
+    naive = [reference(x[rows], y[rows])[0] for rows in rng.integers(0, len(x), size=(2000, len(x)))]
+    assert low < reference(x, y)[0] < high
+    assert low == pytest.approx(np.percentile(naive, 2.5), abs=0.03)
+    assert high == pytest.approx(np.percentile(naive, 97.5), abs=0.03)
+
+
+def test_bootstrap_ci_is_the_same_on_a_pool():
+    # Small batches, so the resamples are spread over several pool tasks
+    x, y = correlated_pairs(5000, "continuous")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        pooled = bootstrap_ci(x, y, "spearman", n_resamples=300, pool=pool)
+
+    assert pooled == bootstrap_ci(x, y, "spearman", n_resamples=300)
+
+
+def naive_permutation_p(x, y, method, permutations=4000, seed=1):
+    """Share of random shuffles of y whose |r| with x is at least the observed |r|"""
+    if method == "spearman":
+        x, y = rankdata(x), rankdata(y)
+    # Under a shuffle only the cross product of the centred values changes
+    x, y = x - x.mean(), y - y.mean()
+    observed = abs(x @ y) * (1 - 1e-12)
+    rng = np.random.default_rng(seed)
+    hits = 0
+    for _ in range(permutations // 500):
+        shuffled = rng.permuted(np.tile(y, (500, 1)), axis=1)
+        hits += int((np.abs(shuffled @ x) >= observed).sum())
+    return hits / permutations
+
+
+# Likert pairs are permuted as contingency tables, continuous pairs as shuffled rows
+@pytest.mark.parametrize("kind, n, seed, weight", [("likert", 2000, 1, 0.04), ("continuous", 300, 2, 0.15)])
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_permutation_test_matches_naive_shuffles(kind, n, seed, weight, method):
+    x, y = correlated_pairs(n, kind, seed, weight)
+    p, done = permutation_test(x, y, method)
+
+    expected = naive_permutation_p(x, y, method)
+    assert 0.05 < expected < 0.95
+    error = np.sqrt(expected * (1 - expected) * (1 / done + 1 / 4000))
+    assert abs(p - expected) <= 4 * error + 2 / done
+
+
+def test_permutation_test_stops_early_when_clearly_significant():
+    x, y = correlated_pairs(300, "continuous")
+    p, done = permutation_test(x, y, "spearman")
+
+    assert done < PERMUTATION_MAX
+    assert p == 1 / (done + 1)  # no shuffle came close
+    assert p < 0.05
+
+
+def test_permutation_test_bounds_shuffled_rows():
+    x, y = correlated_pairs(50_000, "continuous", weight=0.0)
+    # An alpha right at the p-value never lets sampling stop early
+    _, done = permutation_test(x, y, "pearson", alpha=pearsonr(x, y)[1])
+
+    assert done == max(100, PERMUTATION_MAX_CELLS // len(x))